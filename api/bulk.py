@@ -0,0 +1,81 @@
+"""Массовое создание записей, комментариев и лайков через API.
+
+Все элементы проверяются одним проходом сериализатора, а вставка
+выполняется `bulk_create` в одной транзакции. Сигналы при этом не
+отправляются, поэтому ленты, счетчики и версии коллекций обновляются
+здесь же одним действием на всю пачку.
+"""
+from django.db import transaction
+from django.db.models import F
+from rest_framework import serializers
+
+from posts import likes, live, stats, timeline, versions
+from posts.models import Comment, Post
+
+MAX_ITEMS = 500
+BATCH_SIZE = 100
+
+
+def items(request):
+    """Возвращает список элементов из тела запроса"""
+    data = request.data
+    if not isinstance(data, list):
+        raise serializers.ValidationError(
+            {'detail': 'Ожидается JSON-массив'}
+        )
+    if len(data) > MAX_ITEMS:
+        raise serializers.ValidationError(
+            {'detail': f'Не больше {MAX_ITEMS} элементов за запрос'}
+        )
+    return data
+
+
+def _insert(model, objs, author):
+    """Вставляет строки и проставляет им id.
+
+    На SQLite Django 2.2 не возвращает id из `bulk_create`. Пока
+    транзакция держит блокировку записи, последние строки автора -
+    это только что вставленные.
+    """
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+    if objs and objs[0].pk is None:
+        created = (model.objects.filter(author=author).order_by('-id')
+                   .values_list('id', flat=True)[:len(objs)])
+        for obj, pk in zip(objs, reversed(created)):
+            obj.pk = pk
+            obj._state.adding = False
+    return objs
+
+
+def create_posts(author, validated):
+    """Создает записи автора одной транзакцией"""
+    posts = [Post(author=author, **attrs) for attrs in validated]
+    with transaction.atomic():
+        _insert(Post, posts, author)
+        timeline.fan_out_many(posts)
+        live.reset()
+    stats.invalidate(author.pk)
+    versions.bump('posts')
+    return posts
+
+
+def create_comments(author, post, validated):
+    """Создает комментарии к записи одной транзакцией"""
+    comments = [Comment(author=author, post=post, **attrs)
+                for attrs in validated]
+    with transaction.atomic():
+        _insert(Comment, comments, author)
+        Post.objects.filter(pk=post.pk).update(
+            num_comments=F('num_comments') + len(comments),
+            version=F('version') + 1
+        )
+    versions.bump(f'comments:{post.pk}')
+    return comments
+
+
+def set_likes(user, validated):
+    """Ставит и снимает лайки, возвращая итог по каждому элементу"""
+    wanted = {item['post']: item['liked'] for item in validated}
+    num_likes = likes.set_likes(user, wanted)
+    return [{'post': item['post'], 'liked': wanted[item['post']],
+             'num_likes': num_likes[item['post']]} for item in validated]
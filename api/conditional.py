@@ -0,0 +1,112 @@
+"""Условные запросы API: ETag, Last-Modified и If-Match.
+
+Валидаторы строятся из версии коллекции или записи, а не из тела
+ответа, поэтому ответ 304 отдается до запросов за строками и до
+сериализации.
+"""
+import hashlib
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from posts import versions
+from posts.models import Post
+
+
+def collection_etag(request, version):
+    """ETag страницы коллекции: версия, адрес с параметрами и формат"""
+    key = (f'{version}|{request.get_full_path()}|'
+           f'{request.accepted_media_type}')
+    return '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+
+def post_etag(post):
+    """ETag записи по ее версии"""
+    return f'"post-{post.pk}-{post.version}"'
+
+
+class ConditionalListMixin:
+    """Отвечает 304 на повторный запрос неизменившейся коллекции"""
+    version_name = None
+
+    def get_version_name(self):
+        return self.version_name
+
+    def is_conditional(self):
+        return versions.shared()
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_conditional():
+            return super().list(request, *args, **kwargs)
+        version = versions.get(self.get_version_name())
+        etag = collection_etag(request, version)
+        last_modified = version // 10 ** 9
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ConditionalPostMixin:
+    """ETag записи и защита от потерянных изменений через If-Match"""
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = post_etag(instance)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        response['ETag'] = etag
+        return response
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        with transaction.atomic():
+            instance = self.get_object()
+            response = self.check_if_match(request, instance)
+            if response is not None:
+                return response
+            serializer = self.get_serializer(instance, data=request.data,
+                                             partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+        response = Response(serializer.data)
+        response['ETag'] = post_etag(serializer.instance)
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            instance = self.get_object()
+            response = self.check_if_match(request, instance)
+            if response is not None:
+                return response
+            self.perform_destroy(instance)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def check_if_match(self, request, instance):
+        """Проверяет If-Match, устаревший ETag дает 412 Precondition Failed.
+
+        Совпавшая версия закрепляется условным UPDATE до конца транзакции:
+        он берет блокировку записи, и параллельный запрос с тем же ETag
+        после нее уже не найдет строку с этой версией.
+        """
+        response = get_conditional_response(request,
+                                            etag=post_etag(instance))
+        if response is not None:
+            return response
+        if request.META.get('HTTP_IF_MATCH', '*').strip() == '*':
+            return None
+        locked = Post.objects.filter(
+            pk=instance.pk, version=instance.version
+        ).update(version=F('version'))
+        if not locked:
+            return Response(status=status.HTTP_412_PRECONDITION_FAILED)
+        return None
@@ -0,0 +1,30 @@
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+from posts import export
+
+
+class ExportView(APIView):
+    """Потоковая выгрузка записей или комментариев для аналитики"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, kind):
+        if kind not in export.KINDS:
+            raise Http404
+        output = request.query_params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            raise ValidationError({'output': list(export.FORMATS)})
+        try:
+            since = export.parse_since(request.query_params.get('since'))
+        except ValueError as error:
+            raise ValidationError({'since': str(error)})
+        response = StreamingHttpResponse(
+            export.stream(kind, output, since),
+            content_type=export.FORMATS[output]
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{kind}.{output}"'
+        )
+        return response
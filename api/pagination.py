@@ -0,0 +1,21 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class PostCursorPagination(CursorPagination):
+    """Курсорная паджинация записей от новых к старым"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+
+
+class CommentCursorPagination(PostCursorPagination):
+    """Курсорная паджинация комментариев от новых к старым"""
+    ordering = ('-created', '-id')
+
+
+class RankedPagination(PageNumberPagination):
+    """Постраничная выдача результатов поиска в порядке релевантности"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -20,6 +20,47 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ('author', 'id')
 
 
+class BulkCommentSerializer(CommentSerializer):
+    """Комментарий из пачки: запись берется из адреса запроса"""
+
+    class Meta(CommentSerializer.Meta):
+        read_only_fields = ('author', 'id', 'post')
+
+
+class LikeListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        """Проверяет существование всех записей одним запросом.
+
+        Запись может встречаться в пачке один раз: иначе у ее элементов
+        не было бы отдельных результатов.
+        """
+        attrs = super().to_internal_value(data)
+        existing = set(Post.objects.filter(
+            pk__in={item['post'] for item in attrs}
+        ).values_list('pk', flat=True))
+        seen = set()
+        errors = []
+        for item in attrs:
+            if item['post'] not in existing:
+                errors.append({'post': ['Запись не найдена']})
+            elif item['post'] in seen:
+                errors.append({'post': ['Запись уже есть в пачке']})
+            else:
+                errors.append({})
+            seen.add(item['post'])
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class LikeSerializer(serializers.Serializer):
+    post = serializers.IntegerField()
+    liked = serializers.BooleanField(default=True)
+
+    class Meta:
+        list_serializer_class = LikeListSerializer
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -1,3 +1,278 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils.cache import get_conditional_response
+
+from posts import live
+from posts.models import Comment, Follow, Like, Post, User
+
+
+class TestPagination(TestCase):
+    def setUp(self):
+        """Предварительная настройка"""
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='api_user', password='qwerty'
+        )
+        self.client.force_login(self.user)
+
+    def create_posts(self, start, count):
+        for number in range(start, start + count):
+            author = User.objects.create_user(username=f'author_{number}')
+            post = Post.objects.create(author=author, text=f'post {number}')
+            Comment.objects.create(post=post, author=author, text='comment')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context), response.json()
+
+    def test_posts_query_count(self):
+        """Число запросов на страницу записей не зависит от их количества"""
+        self.create_posts(0, 3)
+        few, data = self.count_queries('/api/v1/posts/')
+        self.assertEqual(len(data['results']), 3)
+        self.assertIsNone(data['next'])
+        self.create_posts(3, 30)
+        many, data = self.count_queries('/api/v1/posts/')
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(few, many)
+        self.assertEqual(data['results'][0]['author'], 'author_32')
+        next_page, data = self.count_queries(data['next'])
+        self.assertEqual(len(data['results']), 13)
+        self.assertEqual(data['results'][-1]['author'], 'author_0')
+        self.assertEqual(few, next_page)
+
+    def test_comments_query_count(self):
+        """Число запросов на страницу комментариев постоянно"""
+        post = Post.objects.create(author=self.user, text='post')
+        url = f'/api/v1/posts/{post.id}/comments/'
+        Comment.objects.create(post=post, author=self.user, text='first')
+        few, _ = self.count_queries(url)
+        for number in range(30):
+            author = User.objects.create_user(username=f'reader_{number}')
+            Comment.objects.create(post=post, author=author, text='comment')
+        many, data = self.count_queries(url)
+        self.assertEqual(few, many)
+        self.assertEqual(len(data['results']), 20)
+
+
+class TestConditional(TestCase):
+    def setUp(self):
+        """Предварительная настройка"""
+        # Условные ответы строятся только на общем для воркеров кеше
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = override_settings(CACHES={'default': {
+            'BACKEND': 'yatube.cache.SQLiteCache',
+            'LOCATION': os.path.join(directory.name, 'cache.sqlite3'),
+        }})
+        shared.enable()
+        self.addCleanup(shared.disable)
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='api_user', password='qwerty'
+        )
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(author=self.user, text='post')
+
+    def test_not_modified(self):
+        """Тест ответа 304 на неизменившуюся коллекцию"""
+        url = '/api/v1/posts/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in context
+                          if 'posts_post' in query['sql']])
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.client.get(url + '?page_size=1')['ETag'],
+                            etag)
+        Comment.objects.create(post=self.post, author=self.user, text='new')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        Post.objects.create(author=self.user, text='new post')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_not_conditional(self):
+        """Тест ответов без ETag на кеше воркера и для поиска"""
+        url = '/api/v1/posts/'
+        etag = self.client.get(url)['ETag']
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('ETag', response)
+        response = self.client.get(url + '?search=post',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_if_match(self):
+        """Тест отказа в изменении записи по устаревшему ETag"""
+        url = f'/api/v1/posts/{self.post.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        response = self.client.patch(url, {'text': 'first'},
+                                     content_type='application/json',
+                                     HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.patch(url, {'text': 'second'},
+                                     content_type='application/json',
+                                     HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'first')
+
+    def test_if_match_race(self):
+        """Тест двух изменений с одним ETag, прошедших проверку вместе"""
+        url = f'/api/v1/posts/{self.post.id}/'
+        etag = self.client.get(url)['ETag']
+        check = get_conditional_response
+
+        def racing(request, **kwargs):
+            # Первый запрос сохраняет запись сразу после проверки второго
+            response = check(request, **kwargs)
+            post = Post.objects.get(pk=self.post.pk)
+            post.text = 'first'
+            post.save()
+            return response
+
+        with mock.patch('api.conditional.get_conditional_response', racing):
+            response = self.client.patch(url, {'text': 'second'},
+                                         content_type='application/json',
+                                         HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.text, self.post.version), ('first', 1))
+
+
+class TestBulk(TransactionTestCase):
+    def setUp(self):
+        """Предварительная настройка"""
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='api_user', password='qwerty'
+        )
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.client.force_login(self.user)
+
+    def post_json(self, url, data):
+        return self.client.post(url, data, content_type='application/json')
+
+    def test_bulk_posts(self):
+        """Тест создания записей пачкой"""
+        response = self.post_json('/api/v1/posts/bulk/',
+                                  [{'text': 'one'}, {'text': ''}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()), 2)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(live.high_water(), 0)
+        response = self.post_json('/api/v1/posts/bulk/',
+                                  [{'text': 'one'}, {'text': 'two'}])
+        self.assertEqual(response.status_code, 201)
+        created = {item['id']: item['text'] for item in response.json()}
+        self.assertEqual(
+            created, dict(Post.objects.values_list('id', 'text'))
+        )
+        # Отметка новых записей сброшена после коммита пачки
+        self.assertEqual(live.high_water(), max(created))
+        self.assertEqual(self.reader.timeline.count(), 2)
+        response = self.post_json('/api/v1/posts/bulk/', {'text': 'one'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_comments_and_likes(self):
+        """Тест создания комментариев и лайков пачкой"""
+        post = Post.objects.create(author=self.user, text='post')
+        response = self.post_json(
+            f'/api/v1/posts/{post.id}/comments/bulk/',
+            [{'text': 'first'}, {'text': 'second'}]
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['post'] for item in response.json()],
+                         [post.id, post.id])
+        post.refresh_from_db()
+        self.assertEqual(post.num_comments, 2)
+        response = self.post_json('/api/v1/posts/likes/',
+                                  [{'post': post.id}, {'post': 0}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[0], {})
+        response = self.post_json(
+            '/api/v1/posts/likes/',
+            [{'post': post.id}, {'post': post.id, 'liked': False}]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('post', response.json()[1])
+        response = self.post_json('/api/v1/posts/likes/', [{'post': post.id}])
+        self.assertEqual(response.json(),
+                         [{'post': post.id, 'liked': True, 'num_likes': 1}])
+        response = self.post_json('/api/v1/posts/likes/',
+                                  [{'post': post.id, 'liked': False}])
+        self.assertEqual(response.json()[0]['num_likes'], 0)
+        self.assertFalse(Like.objects.exists())
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        """Предварительная настройка"""
+        self.client = Client()
+        self.admin = User.objects.create_user(
+            username='admin', password='qwerty', is_staff=True
+        )
+        self.client.force_login(self.admin)
+        self.old = Post.objects.create(author=self.admin, text='old')
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=self.old.pub_date - timedelta(days=30)
+        )
+        self.new = Post.objects.create(author=self.admin, text='новая')
+        Comment.objects.create(post=self.new, author=self.admin, text='ok')
+
+    def test_export(self):
+        """Тест потоковой выгрузки записей и комментариев"""
+        response = self.client.get('/api/v1/export/posts/')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['text'] for line in lines],
+                         ['old', 'новая'])
+        since = (self.new.pub_date - timedelta(days=1)).date().isoformat()
+        response = self.client.get('/api/v1/export/comments/',
+                                   {'output': 'csv', 'since': since})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,post,author,text,created')
+        self.assertEqual(len(lines), 2)
+        response = self.client.get('/api/v1/export/posts/',
+                                   {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        output = StringIO()
+        call_command('export_corpus', 'posts', since=since, stdout=output)
+        self.assertEqual(json.loads(output.getvalue())['id'], self.new.id)
+        self.client.force_login(
+            User.objects.create_user(username='reader')
+        )
+        response = self.client.get('/api/v1/export/posts/')
+        self.assertEqual(response.status_code, 403)
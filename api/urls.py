@@ -3,6 +3,7 @@ from django.urls import include, path
 from rest_framework.authtoken import views
 from rest_framework.routers import DefaultRouter
 
+from .export import ExportView
 from .views import CommentViewSet, GroupViewSet, PostViewSet, UserViewSet
 
 v1_router = DefaultRouter()
@@ -14,5 +15,6 @@ v1_router.register(
 
 urlpatterns = [
     path('v1/api-token-auth/', views.obtain_auth_token),
+    path('v1/export/<str:kind>/', ExportView.as_view(), name='export'),
     path('v1/', include(v1_router.urls)),
 ]
@@ -1,13 +1,21 @@
 
+from django.db.models import Case, IntegerField, When
 from django.shortcuts import get_object_or_404
 
+from posts import search
 from posts.models import Comment, Group, Post, User
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from . import bulk
+from .conditional import ConditionalListMixin, ConditionalPostMixin
+from .pagination import (CommentCursorPagination, PostCursorPagination,
+                         RankedPagination)
 from .permissions import IsOwnerOrReadOnly
-from .serializers import (CommentSerializer, GroupSerializer, PostSerializer,
+from .serializers import (BulkCommentSerializer, CommentSerializer,
+                          GroupSerializer, LikeSerializer, PostSerializer,
                           UserSerializer)
 
 
@@ -16,27 +24,103 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = UserSerializer
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(ConditionalPostMixin, ConditionalListMixin,
+                  viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsOwnerOrReadOnly, IsAuthenticated]
+    pagination_class = PostCursorPagination
+    version_name = 'posts'
+
+    @property
+    def paginator(self):
+        """Результаты поиска листаются по страницам в порядке ранга"""
+        if not hasattr(self, '_paginator'):
+            if 'search' in self.request.query_params:
+                self._paginator = RankedPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def is_conditional(self):
+        # Результаты поиска зависят и от текста комментариев, а версия
+        # коллекции записей их изменений не учитывает
+        return (super().is_conditional()
+                and 'search' not in self.request.query_params)
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('author')
+        if self.action == 'list':
+            queryset = queryset.only(
+                'id', 'text', 'pub_date', 'image', 'author__username'
+            )
+        query = self.request.query_params.get('search')
+        if query is None:
+            return queryset
+        post_ids = search.search_ids(query)
+        if not post_ids:
+            return queryset.none()
+        rank = Case(*[When(pk=pk, then=position)
+                      for position, pk in enumerate(post_ids)],
+                    output_field=IntegerField())
+        return queryset.filter(pk__in=post_ids).order_by(rank)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Создает записи из JSON-массива одной транзакцией"""
+        serializer = self.get_serializer(data=bulk.items(request), many=True)
+        serializer.is_valid(raise_exception=True)
+        posts = bulk.create_posts(request.user, serializer.validated_data)
+        return Response(self.get_serializer(posts, many=True).data,
+                        status=status.HTTP_201_CREATED)
 
-class CommentViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def likes(self, request):
+        """Ставит и снимает лайки из JSON-массива одной транзакцией"""
+        serializer = LikeSerializer(data=bulk.items(request), many=True)
+        serializer.is_valid(raise_exception=True)
+        return Response(bulk.set_likes(request.user,
+                                       serializer.validated_data))
+
+
+class CommentViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [IsOwnerOrReadOnly, IsAuthenticated]
+    pagination_class = CommentCursorPagination
+
+    def get_version_name(self):
+        return f'comments:{self.kwargs["post_id"]}'
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, post_id):
+        """Создает комментарии к записи из JSON-массива"""
+        post = get_object_or_404(Post, pk=post_id)
+        serializer = BulkCommentSerializer(data=bulk.items(request),
+                                           many=True)
+        serializer.is_valid(raise_exception=True)
+        comments = bulk.create_comments(request.user, post,
+                                        serializer.validated_data)
+        return Response(BulkCommentSerializer(comments, many=True).data,
+                        status=status.HTTP_201_CREATED)
+
     def get_queryset(self):
-        return Comment.objects.filter(**self.kwargs)
+        queryset = (Comment.objects.filter(**self.kwargs)
+                    .select_related('author'))
+        if self.action == 'list':
+            queryset = queryset.only(
+                'id', 'text', 'created', 'post_id', 'author__username'
+            )
+        return queryset
 
 
-class GroupViewSet(viewsets.ReadOnlyModelViewSet):
+class GroupViewSet(ConditionalListMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = GroupSerializer
     queryset = Group.objects.all()
+    version_name = 'groups'
     # permission_classes = [IsAuthenticated]
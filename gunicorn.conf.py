@@ -0,0 +1,37 @@
+"""Настройки gunicorn.
+
+Воркеры gthread обслуживают запросы в ограниченном пуле потоков: пока
+один поток ждет медленного клиента (например, загрузку картинки),
+остальные потоки воркера продолжают отвечать.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS',
+                        multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Перезапуск воркеров ограничивает рост памяти, jitter разводит их во времени
+max_requests = 2000
+max_requests_jitter = 200
+# Файл пульса воркера в памяти, а не на диске контейнера
+worker_tmp_dir = '/dev/shm'
+
+
+def worker_exit(server, worker):
+    """Сохраняет состояние процесса перед выходом воркера.
+
+    При перезапуске по max_requests иначе пропали бы буфер посещений и
+    еще не обработанные картинки.
+    """
+    from posts import activity, images
+
+    images.shutdown()
+    try:
+        activity.flush()
+    except Exception:
+        server.log.exception('Не удалось записать посещения')
@@ -0,0 +1,88 @@
+"""Отложенная запись времени последнего посещения.
+
+Middleware только отмечает пользователя в буфере процесса и в кеше,
+а строки `Activity` обновляются одной пачкой раз в
+`ACTIVITY_FLUSH_INTERVAL_SECS` секунд.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Activity, User
+
+_pending = {}
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _key(user_id):
+    return f'last-seen:{user_id}'
+
+
+def touch(user_id):
+    """Запоминает посещение пользователя без записи в базу"""
+    now = timezone.now()
+    interval = settings.LAST_ACTIVITY_INTERVAL_SECS
+    with _lock:
+        previous = _pending.get(user_id)
+        if previous and (now - previous).total_seconds() < interval:
+            return
+        _pending[user_id] = now
+    cache.set(_key(user_id), now, settings.ACTIVITY_FLUSH_INTERVAL_SECS * 2)
+
+
+def last_seen(user):
+    """Возвращает время последнего посещения с учетом буфера"""
+    seen = cache.get(_key(user.pk))
+    if seen is None:
+        with _lock:
+            seen = _pending.get(user.pk)
+    if seen is None:
+        seen = (Activity.objects.filter(user=user)
+                .values_list('time', flat=True).first())
+    return seen
+
+
+def flush():
+    """Записывает накопленные посещения одной пачкой"""
+    global _last_flush
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return 0
+    try:
+        with transaction.atomic():
+            return _write(dict(pending))
+    except Exception:
+        # Посещения возвращаются в буфер, кроме уже отмеченных заново
+        with _lock:
+            for user_id, seen in pending.items():
+                _pending.setdefault(user_id, seen)
+        raise
+
+
+def _write(pending):
+    existing = list(Activity.objects.filter(user_id__in=pending))
+    for activity in existing:
+        activity.time = pending.pop(activity.user_id)
+    Activity.objects.bulk_update(existing, ['time'])
+    created = [
+        Activity(user_id=user_id, time=pending[user_id])
+        for user_id in (User.objects.filter(pk__in=pending)
+                        .values_list('pk', flat=True))
+    ]
+    Activity.objects.bulk_create(created, ignore_conflicts=True)
+    return len(existing) + len(created)
+
+
+def flush_if_due():
+    """Сбрасывает буфер, если с прошлого сброса прошел интервал"""
+    elapsed = time.monotonic() - _last_flush
+    if elapsed >= settings.ACTIVITY_FLUSH_INTERVAL_SECS:
+        flush()
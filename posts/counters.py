@@ -0,0 +1,43 @@
+"""Денормализованные счетчики лайков и комментариев записи.
+
+Счетчики меняются одним атомарным UPDATE с F-выражением, поэтому
+конкурентные лайки не теряются и не требуют чтения строки записи.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Like, Post
+
+COUNTERS = {
+    'num_likes': Like,
+    'num_comments': Comment,
+}
+
+
+def increment(post_id, field):
+    """Увеличивает счетчик записи на единицу"""
+    Post.objects.filter(pk=post_id).update(
+        **{field: F(field) + 1}, version=F('version') + 1
+    )
+
+
+def decrement(post_id, field):
+    """Уменьшает счетчик записи на единицу, не опуская ниже нуля"""
+    (Post.objects.filter(pk=post_id, **{f'{field}__gt': 0})
+     .update(**{field: F(field) - 1}, version=F('version') + 1))
+
+
+def recount(post_ids=None):
+    """Пересчитывает счетчики по фактическим строкам лайков и комментариев"""
+    posts = Post.objects.all()
+    if post_ids is not None:
+        posts = posts.filter(pk__in=post_ids)
+    values = {}
+    for field, model in COUNTERS.items():
+        counted = (model.objects.filter(post=OuterRef('pk'))
+                   .order_by().values('post')
+                   .annotate(total=Count('pk')).values('total'))
+        values[field] = Coalesce(
+            Subquery(counted, output_field=IntegerField()), 0
+        )
+    return posts.update(**values, version=F('version') + 1)
@@ -0,0 +1,97 @@
+"""Потоковая выгрузка записей и комментариев в NDJSON и CSV.
+
+Строки читаются через `iterator(chunk_size)` в виде кортежей, без
+создания моделей, и сразу превращаются в строки вывода, поэтому
+память не растет с размером таблиц.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Comment, Post
+
+CHUNK_SIZE = 2000
+
+# Поле выгрузки -> путь в values_list
+KINDS = {
+    'posts': (Post, 'pub_date', {
+        'id': 'id',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'image': 'image',
+        'num_likes': 'num_likes',
+        'num_comments': 'num_comments',
+    }),
+    'comments': (Comment, 'created', {
+        'id': 'id',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    }),
+}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def parse_since(value):
+    """Разбирает since= как дату или дату со временем"""
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError('Ожидается дата ISO 8601')
+        since = timezone.datetime.combine(day, timezone.datetime.min.time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def rows(kind, since=None):
+    """Возвращает кортежи строк выгрузки по возрастанию id"""
+    model, date_field, fields = KINDS[kind]
+    queryset = model.objects.order_by('pk')
+    if since is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': since})
+    return (queryset.values_list(*fields.values())
+            .iterator(chunk_size=CHUNK_SIZE))
+
+
+class _Echo:
+    """Буфер для csv.writer, который просто возвращает строку"""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(kind, since=None):
+    names = list(KINDS[kind][2])
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows(kind, since):
+        yield encoder.encode(dict(zip(names, row))) + '\n'
+
+
+def csv_lines(kind, since=None):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(list(KINDS[kind][2]))
+    for row in rows(kind, since):
+        yield writer.writerow(
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in row
+        )
+
+
+def stream(kind, output='ndjson', since=None):
+    """Генератор строк выгрузки в нужном формате"""
+    if output == 'csv':
+        return csv_lines(kind, since)
+    return ndjson_lines(kind, since)
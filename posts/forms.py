@@ -2,7 +2,6 @@ import json
 
 from django import forms
 from django.utils.text import slugify
-from PIL import Image
 
 from .models import Comment, Group, Post
 
@@ -25,21 +24,23 @@ class PostForm(forms.ModelForm):
             'image': 'Добавьте картинку',
         }
 
-    def save(self):
-        post = super().save(commit=False)
+    def clean_crop_data(self):
+        """Проверяет область обрезки, сама обрезка выполняется в фоне"""
         json_data = self.cleaned_data.get('crop_data')
-        if json_data:
+        if not json_data:
+            return None
+        try:
             data = json.loads(json_data)
-            img = self.cleaned_data['image']
-            image = Image.open(img)
-            x = data['x']
-            y = data['y']
-            w = data['width']
-            h = data['height']
-            cropped = image.crop((x, y, w+x, h+y))
-            post.image.open()
-            cropped.save(post.image)
-        return post
+            x, y = int(data['x']), int(data['y'])
+            w, h = int(data['width']), int(data['height'])
+        except (ValueError, TypeError, KeyError):
+            raise forms.ValidationError('Неверная область обрезки')
+        if x < 0 or y < 0 or w <= 0 or h <= 0:
+            raise forms.ValidationError('Неверная область обрезки')
+        return (x, y, x + w, y + h)
+
+    def save(self):
+        return super().save(commit=False)
 
 
 class CommentForm(forms.ModelForm):
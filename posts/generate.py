@@ -0,0 +1,130 @@
+"""Синтетические данные для проверок планов запросов и нагрузки.
+
+Все строки получают общий префикс в именах пользователей и адресах
+сообществ. Популярность авторов и записей распределена по закону Ципфа
+с показателем `skew` (0 - равномерно): популярные авторы чаще пишут и
+на них чаще подписываются, свежие записи чаще лайкают и комментируют.
+При одинаковом `seed` получается тот же набор данных.
+"""
+import random
+from itertools import islice
+
+from django.db import connection, transaction
+
+from . import counters, timeline
+from .models import Comment, Follow, FollowGroup, Group, Like, Post, User
+
+# Столько объектов собирается в памяти перед одной вставкой bulk_create
+CHUNK = 10000
+
+WORDS = (
+    'утро', 'город', 'река', 'книга', 'дорога', 'письмо', 'окно', 'вечер',
+    'поезд', 'снег', 'музыка', 'друг', 'лето', 'море', 'кофе', 'работа',
+    'сад', 'небо', 'ветер', 'дом', 'история', 'фото', 'праздник', 'лес',
+)
+
+
+def _insert(model, objects, **options):
+    objects = iter(objects)
+    while True:
+        chunk = list(islice(objects, CHUNK))
+        if not chunk:
+            return
+        model.objects.bulk_create(chunk, **options)
+
+
+def _chooser(rnd, values, skew):
+    """Возвращает функцию выбора k значений, первые - самые частые"""
+    values = list(values)
+    if not skew:
+        return lambda k: rnd.choices(values, k=k)
+    total, weights = 0.0, []
+    for rank in range(1, len(values) + 1):
+        total += rank ** -skew
+        weights.append(total)
+    return lambda k: rnd.choices(values, cum_weights=weights, k=k)
+
+
+def _stream(pick, total):
+    """Выбирает total значений порциями, не держа весь список в памяти"""
+    for start in range(0, total, CHUNK):
+        yield from pick(min(CHUNK, total - start))
+
+
+def _text(rnd, low, high):
+    return ' '.join(rnd.choices(WORDS, k=rnd.randint(low, high)))
+
+
+def _spread_dates(first, last):
+    """Разносит даты записей по минутам: чем больше id, тем новее"""
+    sql = {
+        'sqlite': "UPDATE posts_post SET pub_date = strftime("
+                  "'%%Y-%%m-%%d %%H:%%M:%%f', pub_date, "
+                  "'-' || (%s - id) || ' minutes') WHERE id >= %s",
+        'postgresql': "UPDATE posts_post SET pub_date = pub_date - "
+                      "(%s - id) * interval '1 minute' WHERE id >= %s",
+    }.get(connection.vendor)
+    if sql:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [last, first])
+
+
+def generate(users=1000, posts=100000, likes=1000000, comments=200000,
+             follows=50, groups=20, group_follows=5, timelines=100,
+             skew=1.0, seed=42):
+    """Создает набор данных и возвращает префикс и id его строк.
+
+    Ленты подписок собираются только для первых `timelines`
+    пользователей: на плотном графе подписок полная лента всех
+    пользователей больше самих записей.
+    """
+    rnd = random.Random(seed)
+    prefix = f'gen{rnd.randrange(10 ** 6)}'
+    if User.objects.filter(username__startswith=f'{prefix}_').exists():
+        raise ValueError(f'Данные с префиксом {prefix} уже созданы')
+    with transaction.atomic():
+        _insert(User, (User(username=f'{prefix}_{number}')
+                       for number in range(users)))
+        user_ids = list(User.objects.filter(username__startswith=prefix)
+                        .order_by('pk').values_list('pk', flat=True))
+        _insert(Group, (Group(title=f'{prefix} {number}',
+                              slug=f'{prefix}-{number}', description='')
+                        for number in range(groups)))
+        group_ids = list(Group.objects.filter(slug__startswith=prefix)
+                         .values_list('pk', flat=True))
+        pick_author = _chooser(rnd, user_ids, skew)
+        _insert(Post, (
+            Post(author_id=author_id, text=_text(rnd, 5, 40),
+                 group_id=rnd.choice(group_ids + [None]))
+            for author_id in _stream(pick_author, posts)
+        ))
+        post_ids = list(Post.objects
+                        .filter(author__username__startswith=prefix)
+                        .order_by('pk').values_list('pk', flat=True))
+        # auto_now_add дает всем записям одно время
+        _spread_dates(post_ids[0], post_ids[-1])
+        pick_post = _chooser(rnd, reversed(post_ids), skew)
+        _insert(Comment, (
+            Comment(post_id=post_id, author_id=rnd.choice(user_ids),
+                    text=_text(rnd, 2, 15))
+            for post_id in _stream(pick_post, comments)
+        ))
+        _insert(Like, (
+            Like(post_id=post_id, user_id=rnd.choice(user_ids))
+            for post_id in _stream(pick_post, likes)
+        ), ignore_conflicts=True)
+        _insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in set(pick_author(follows)) - {user_id}
+        ), ignore_conflicts=True)
+        _insert(FollowGroup, (
+            FollowGroup(user_id=user_id, group_id=group_id)
+            for user_id in user_ids
+            for group_id in rnd.sample(group_ids,
+                                       min(group_follows, len(group_ids)))
+        ))
+        counters.recount()
+        timeline.rebuild(user_ids[:timelines])
+    return {'prefix': prefix, 'users': user_ids, 'groups': group_ids,
+            'posts': post_ids}
@@ -0,0 +1,400 @@
+"""Фоновая подготовка картинок записей.
+
+После сохранения картинки обрезка, уменьшение до допустимого размера и
+варианты для карточки создаются в пуле потоков уже после коммита
+транзакции, а не при первом показе записи. Пока они не готовы, шаблон
+показывает оригинал.
+
+Варианты карточки - картинки нескольких ширин в форматах
+POST_IMAGE_FORMATS. Их имена и размеры хранятся в записи в JSON, поэтому
+шаблон строит <picture> и srcset без обращений к хранилищу. Картинки
+записей, созданных раньше, обрабатывает команда backfill_images.
+"""
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from PIL import Image, ImageOps, features
+
+from . import versions
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Миниатюра карточки, созданная до адаптивных вариантов: пока их нет,
+# карточка показывает ее вместо оригинала
+CARD_THUMBNAIL = ('960x339', {'crop': 'center', 'upscale': True})
+
+# Размеры картинки карточки и ее ширина на странице
+CARD_WIDTH = 960
+CARD_RATIO = CARD_WIDTH / 339
+CARD_SIZES = '(min-width: 1200px) 825px, (min-width: 768px) 75vw, 100vw'
+
+# Формат Pillow, MIME-тип и параметры сохранения вариантов
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 50}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True,
+                                    'progressive': True}),
+}
+
+# Тег EXIF с ориентацией снимка и ее значения с поворотом на 90 градусов
+EXIF_ORIENTATION = 0x0112
+ROTATED = (5, 6, 7, 8)
+# Сколько не пытаться снова обработать картинку после ошибки
+FAILURE_TIMEOUT = 60 * 60
+
+_executor = None
+_process_pool = None
+_scheduled = set()
+_lock = threading.Lock()
+
+
+class ReadyThumbnailBackend(ThumbnailBackend):
+    """Ищет готовую миниатюру, не создавая ее"""
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        name = self._thumbnail_name(ImageFile(file_), geometry_string,
+                                    options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+    def _thumbnail_name(self, source, geometry_string, options):
+        # Повторяет get_thumbnail из sorl-thumbnail 12.6 до создания файла
+        # и зависит от его закрытых методов _get_format и
+        # _get_thumbnail_filename: при обновлении sorl сверять с ним
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(thumbnail_defaults, attr):
+                options.setdefault(key, value)
+        return self._get_thumbnail_filename(source, geometry_string, options)
+
+
+backend = ReadyThumbnailBackend()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.POST_IMAGE_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def _get_process_pool():
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.POST_IMAGE_PROCESSES
+            )
+        return _process_pool
+
+
+def shutdown():
+    """Дожидается поставленных в очередь задач и останавливает пулы"""
+    global _executor, _process_pool
+    with _lock:
+        executor, process_pool = _executor, _process_pool
+        _executor = _process_pool = None
+    # Задачи потоков отправляют обрезку в пул процессов, поэтому он
+    # останавливается вторым
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if process_pool is not None:
+        process_pool.shutdown(wait=True)
+
+
+def crop_file(source, target, box, max_side):
+    """Обрезает картинку по box и вписывает ее в квадрат max_side.
+
+    Для JPEG декодер сразу уменьшает картинку (draft), поэтому в памяти
+    не оказывается полноразмерный снимок. Возвращает None, если менять
+    картинку не нужно.
+    """
+    with Image.open(source) as image:
+        # MPO (снимки многих телефонов) Pillow сохраняет только как JPEG
+        image_format = 'JPEG' if image.format == 'MPO' else image.format
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+        stored_width, stored_height = image.size
+        # Браузер показывает картинку уже повернутой, в этих же
+        # координатах приходит и box
+        width, height = image.size
+        if orientation in ROTATED:
+            width, height = height, width
+        left, top, right, bottom = box or (0, 0, width, height)
+        left, top = min(left, width), min(top, height)
+        right, bottom = min(right, width), min(bottom, height)
+        if right <= left or bottom <= top:
+            return None
+        if (box is None and max(width, height) <= max_side
+                and orientation == 1 and image_format == image.format):
+            return None
+        scale = min(1.0, max_side / max(right - left, bottom - top))
+        if scale < 1:
+            image.draft(image.mode, (math.ceil(stored_width * scale),
+                                     math.ceil(stored_height * scale)))
+        upright = ImageOps.exif_transpose(image)
+        ratio_x, ratio_y = upright.width / width, upright.height / height
+        region = upright.crop((round(left * ratio_x), round(top * ratio_y),
+                               round(right * ratio_x),
+                               round(bottom * ratio_y)))
+        region.thumbnail((max_side, max_side), Image.LANCZOS)
+        options = {'format': image_format}
+        if image_format == 'JPEG':
+            options.update(quality=90, optimize=True, progressive=True)
+        region.save(target, **options)
+        return region.size
+
+
+def render_variants(source, widths, formats, ratio=CARD_RATIO):
+    """Обрезает картинку по центру до пропорции ratio и кодирует ее.
+
+    Картинка поворачивается по EXIF, а JPEG декодируется сразу уменьшенным
+    до самого большого варианта (draft). Ширины больше обрезанной
+    картинки пропускаются, кроме самой маленькой. Возвращает список
+    (формат, ширина, высота, данные).
+    """
+    rendered = []
+    with Image.open(source) as image:
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+        stored_width, stored_height = image.size
+        width, height = image.size
+        if orientation in ROTATED:
+            width, height = height, width
+        crop_width = min(width, height * ratio)
+        fitting = [variant_width for variant_width in sorted(widths)
+                   if variant_width <= crop_width] or sorted(widths)[:1]
+        scale = min(1.0, fitting[-1] / crop_width)
+        if scale < 1:
+            image.draft(image.mode, (math.ceil(stored_width * scale),
+                                     math.ceil(stored_height * scale)))
+        upright = ImageOps.exif_transpose(image).convert('RGB')
+        for variant_width in fitting:
+            size = (variant_width, round(variant_width / ratio))
+            variant = ImageOps.fit(upright, size, Image.LANCZOS)
+            for name in formats:
+                image_format, _, options = FORMATS[name]
+                content = BytesIO()
+                variant.save(content, image_format, **options)
+                rendered.append((name, *size, content.getvalue()))
+    return rendered
+
+
+def supported_formats():
+    """Форматы из настроек, которые умеет сохранять Pillow"""
+    return [name for name in settings.POST_IMAGE_FORMATS
+            if name == 'jpeg' or features.check(name)]
+
+
+def make_variants(name):
+    """Сохраняет варианты картинки и возвращает их описание в JSON"""
+    storage = Post._meta.get_field('image').storage
+    widths, formats = settings.POST_IMAGE_WIDTHS, supported_formats()
+    try:
+        source = storage.path(name)
+    except NotImplementedError:
+        with storage.open(name) as source:
+            rendered = render_variants(source, widths, formats)
+    else:
+        if settings.POST_IMAGE_PROCESSES:
+            rendered = _get_process_pool().submit(
+                render_variants, source, widths, formats
+            ).result()
+        else:
+            rendered = render_variants(source, widths, formats)
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = {}
+    for image_format, width, height, data in rendered:
+        saved = storage.save(f'posts/variants/{stem}-{width}.{image_format}',
+                             ContentFile(data))
+        variants.setdefault(image_format, []).append([saved, width, height])
+    return json.dumps({'source': name, 'formats': variants})
+
+
+def delete_variants(value):
+    """Удаляет файлы вариантов из описания в JSON"""
+    if not value:
+        return
+    storage = Post._meta.get_field('image').storage
+    for files in json.loads(value)['formats'].values():
+        for name, _, _ in files:
+            storage.delete(name)
+
+
+def prepare(post_id, box=None):
+    """Обрезает и уменьшает сохраненную картинку записи"""
+    name = (Post.objects.filter(pk=post_id)
+            .values_list('image', flat=True).first())
+    if not name:
+        return False
+    storage = Post._meta.get_field('image').storage
+    suffix = os.path.splitext(name)[1]
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    with tempfile.NamedTemporaryFile(suffix=suffix) as target:
+        try:
+            source = storage.path(name)
+        except NotImplementedError:
+            with storage.open(name) as source:
+                size = crop_file(source, target, box, max_side)
+        else:
+            if settings.POST_IMAGE_PROCESSES:
+                size = _get_process_pool().submit(
+                    crop_file, source, target.name, box, max_side
+                ).result()
+            else:
+                size = crop_file(source, target.name, box, max_side)
+        if size is None:
+            return False
+        target.seek(0)
+        new_name = storage.save(name, File(target))
+    updated = Post.objects.filter(pk=post_id, image=name).update(
+        image=new_name, version=F('version') + 1
+    )
+    storage.delete(name if updated else new_name)
+    if updated:
+        versions.bump('posts')
+    return bool(updated)
+
+
+def generate(post_id):
+    """Создает все варианты картинки записи и обновляет версию карточки"""
+    name = (Post.objects.filter(pk=post_id)
+            .values_list('image', flat=True).first())
+    if not name:
+        return False
+    previous = (Post.objects.filter(pk=post_id)
+                .values_list('image_variants', flat=True).first())
+    variants = make_variants(name)
+    # Закешированная карточка перерисуется уже с миниатюрой
+    updated = Post.objects.filter(pk=post_id, image=name).update(
+        image_variants=variants, version=F('version') + 1
+    )
+    delete_variants(previous if updated else variants)
+    return True
+
+
+def process(post_id, box=None):
+    """Готовит картинку записи и все ее миниатюры"""
+    prepare(post_id, box)
+    return generate(post_id)
+
+
+def _failed_key(post_id, version):
+    return f'post-image-failed:{post_id}:{version}'
+
+
+def _process(post_id, box):
+    try:
+        process(post_id, box)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры записи %s', post_id)
+        # Показы записи не ставят ее в очередь снова, пока не истечет
+        # отметка или запись не изменится
+        version = (Post.objects.filter(pk=post_id)
+                   .values_list('version', flat=True).first())
+        cache.set(_failed_key(post_id, version), True, FAILURE_TIMEOUT)
+    finally:
+        with _lock:
+            _scheduled.discard(post_id)
+
+
+def _run(post_id, box):
+    try:
+        _process(post_id, box)
+    finally:
+        connection.close()
+
+
+def _submit(post_id, box=None):
+    with _lock:
+        if post_id in _scheduled and box is None:
+            return
+        _scheduled.add(post_id)
+    if settings.POST_IMAGE_WORKERS:
+        _get_executor().submit(_run, post_id, box)
+    else:
+        _process(post_id, box)
+
+
+def schedule(post, box=None):
+    """Ставит обработку картинки в очередь после коммита транзакции"""
+    if post.image and not cache.get(_failed_key(post.pk, post.version)):
+        transaction.on_commit(lambda: _submit(post.pk, box))
+
+
+def find_thumbnail(post, geometry, **options):
+    """Возвращает готовую миниатюру или None, ничего не создавая"""
+    try:
+        return backend.get_ready_thumbnail(post.image, geometry, **options)
+    except Exception:
+        logger.exception('Не удалось найти миниатюру записи %s', post.pk)
+        return None
+
+
+def current_variants(post):
+    """Возвращает варианты, если они созданы для текущей картинки записи"""
+    variants = json.loads(post.image_variants or 'null')
+    if variants and variants['source'] == post.image.name:
+        return variants
+    return None
+
+
+def picture(post, sizes=CARD_SIZES):
+    """Возвращает источники <picture> для карточки записи.
+
+    Если вариантов для текущей картинки еще нет, ставит ее обработку в
+    очередь и возвращает в image старую миниатюру карточки или оригинал.
+    """
+    if not post.image:
+        return {}
+    variants = current_variants(post)
+    if variants is None:
+        schedule(post)
+        geometry, options = CARD_THUMBNAIL
+        return {'image': find_thumbnail(post, geometry, **options)
+                or post.image}
+    storage = post.image.storage
+    sources = []
+    for name, files in variants['formats'].items():
+        sources.append({
+            'type': FORMATS[name][1],
+            'srcset': ', '.join(f'{storage.url(file_name)} {width}w'
+                                for file_name, width, _ in files),
+        })
+    # Для <img> берется последний формат, по умолчанию JPEG, в ширине
+    # ближе всего к обычной миниатюре
+    files = list(variants['formats'].values())[-1]
+    file_name, width, height = min(
+        files, key=lambda file: abs(file[1] - CARD_WIDTH)
+    )
+    return {
+        'sources': sources[:-1],
+        'fallback': sources[-1],
+        'src': storage.url(file_name),
+        'width': width,
+        'height': height,
+        'sizes': sizes,
+    }
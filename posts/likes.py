@@ -0,0 +1,105 @@
+"""Отметки лайков пользователя в кеше.
+
+Для каждой пары (пользователь, запись) в кеше хранится, стоит ли лайк.
+Отметка `is_liked` для страницы ленты делается одним get_many и
+запросом только за промахи, без коррелированного подзапроса на каждую
+строку. После лайка или его снятия ключ записи удаляется, когда
+транзакция зафиксирована: откат не оставит в кеше неверную отметку, а
+одновременные изменения разных записей не затирают друг друга.
+"""
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import F
+
+from .models import Like, Post
+
+LIKED_TIMEOUT = 60 * 60
+
+
+def _key(user_id, post_id):
+    return f'liked:{user_id}:{post_id}'
+
+
+def liked_ids(user, post_ids):
+    """Возвращает множество id из post_ids, лайкнутых пользователем"""
+    if not user.is_authenticated:
+        return frozenset()
+    keys = {_key(user.pk, post_id): post_id for post_id in post_ids}
+    cached = cache.get_many(keys)
+    ids = {keys[key] for key, liked in cached.items() if liked}
+    missing = [post_id for key, post_id in keys.items() if key not in cached]
+    if missing:
+        # Из основной базы: кеш живет дольше закрепления за ней после
+        # записи, и отстающая реплика оставила бы в нем старые лайки
+        found = set(Like.objects.using(DEFAULT_DB_ALIAS)
+                    .filter(user=user, post_id__in=missing)
+                    .values_list('post_id', flat=True))
+        cache.set_many({_key(user.pk, post_id): post_id in found
+                        for post_id in missing}, LIKED_TIMEOUT)
+        ids |= found
+    return ids
+
+
+def forget(user_id, post_id):
+    """Сбрасывает отметку записи после фиксации лайка или его снятия"""
+    transaction.on_commit(lambda: cache.delete(_key(user_id, post_id)))
+
+
+def _insert(user_id, post_id):
+    """Вставляет лайк, если его нет; True, если строка вставлена
+
+    bulk_create(ignore_conflicts=True) не сообщает, какие строки
+    вставлены, поэтому INSERT с пропуском конфликта выполняется по одной
+    строке и смотрит на rowcount. Сигналы при этом не отправляются.
+    """
+    connection = connections[router.db_for_write(Like)]
+    ops = connection.ops
+    table = ops.quote_name(Like._meta.db_table)
+    columns = ', '.join(ops.quote_name(field.column) for field in (
+        Like._meta.get_field('user'), Like._meta.get_field('post')))
+    sql = '%s %s (%s) VALUES (%%s, %%s) %s' % (
+        ops.insert_statement(ignore_conflicts=True), table, columns,
+        ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, post_id])
+        return cursor.rowcount == 1
+
+
+def set_likes(user, wanted):
+    """Приводит лайки пользователя к нужному состоянию.
+
+    `wanted` - словарь {id записи: лайк стоит}. Меняются только лайки,
+    которых нет или которые лишние: повторная постановка или снятие
+    ничего не делают. Счетчики изменяются F-выражениями, без подсчета
+    строк лайков. Возвращает {id записи: число лайков}.
+    """
+    with transaction.atomic():
+        existing = set(Like.objects.filter(user=user, post_id__in=wanted)
+                       .values_list('post_id', flat=True))
+        # Лайк, поставленный параллельным запросом после чтения, вставка
+        # пропускает, и счетчик увеличивается только за вставленные строки
+        added = [post_id for post_id, value in wanted.items()
+                 if value and post_id not in existing
+                 and _insert(user.pk, post_id)]
+        removed = [post_id for post_id, value in wanted.items()
+                   if not value and post_id in existing]
+        if added:
+            Post.objects.filter(pk__in=added).update(
+                num_likes=F('num_likes') + 1, version=F('version') + 1
+            )
+            for post_id in added:
+                forget(user.pk, post_id)
+        if removed:
+            # Удаление отправляет post_delete: сигнал уменьшает счетчик
+            Like.objects.filter(user=user, post_id__in=removed).delete()
+    return dict(Post.objects.filter(pk__in=wanted)
+                .values_list('pk', 'num_likes'))
+
+
+def mark_liked(user, posts):
+    """Проставляет `is_liked` уже выбранным записям"""
+    ids = liked_ids(user, [post.pk for post in posts])
+    for post in posts:
+        post.is_liked = post.pk in ids
+    return posts
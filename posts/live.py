@@ -0,0 +1,55 @@
+"""Проверка новых записей для живых лент.
+
+Курсор ленты - id самой новой показанной записи: id растут вместе с
+датой публикации. Самый большой id хранится в кеше, и пока курсор не
+меньше него, опрос отвечает без запросов к базе. Иначе новые id
+выбираются по диапазону индекса: первичного ключа для главной, внешнего
+ключа сообщества для сообщества и уникального (user, post) для ленты
+подписок.
+"""
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Max
+
+from .models import Post, Timeline
+
+FEEDS = ('index', 'group', 'follow')
+MAX_IDS = 50
+# Отметка могла быть прочитана до коммита новой записи и положена в кеш
+# после ее сброса, поэтому живет недолго
+HIGH_WATER_TIMEOUT = 60
+
+_KEY = 'posts-high-water'
+
+
+def high_water():
+    """Возвращает id самой новой записи"""
+    value = cache.get(_KEY)
+    if value is None:
+        # Из основной базы: с реплики в кеш могла бы попасть старая отметка
+        value = (Post.objects.using(DEFAULT_DB_ALIAS)
+                 .aggregate(last=Max('pk'))['last'] or 0)
+        cache.add(_KEY, value, HIGH_WATER_TIMEOUT)
+    return value
+
+
+def reset():
+    """Сбрасывает отметку после коммита новой записи"""
+    transaction.on_commit(lambda: cache.delete(_KEY))
+
+
+def newer(feed, since, user=None, group_slug=None):
+    """Возвращает до MAX_IDS id записей ленты новее since и их число"""
+    if since >= high_water():
+        return [], 0
+    if feed == 'follow':
+        rows = (Timeline.objects.filter(user=user, post_id__gt=since)
+                .order_by('-post_id').values_list('post_id', flat=True))
+    else:
+        rows = Post.objects.filter(pk__gt=since)
+        if feed == 'group':
+            rows = rows.filter(group__slug=group_slug)
+        rows = rows.order_by('-pk').values_list('pk', flat=True)
+    ids = list(rows[:MAX_IDS + 1])
+    count = rows.count() if len(ids) > MAX_IDS else len(ids)
+    return ids[:MAX_IDS], count
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from posts import images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Создает адаптивные варианты картинок записей, у которых их '
+            'нет или они сделаны для прежней картинки')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'post_ids', nargs='*', type=int,
+            help='id записей (по умолчанию все записи с картинками)'
+        )
+
+    def handle(self, *args, **options):
+        posts = (Post.objects.exclude(image='').exclude(image=None)
+                 .only('image', 'image_variants').order_by('pk'))
+        if options['post_ids']:
+            posts = posts.filter(pk__in=options['post_ids'])
+        done = failed = 0
+        for post in posts.iterator():
+            if images.current_variants(post) is not None:
+                continue
+            try:
+                images.generate(post.pk)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Запись {post.pk}: {error}')
+            else:
+                done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано записей: {done}, с ошибками: {failed}'
+        ))
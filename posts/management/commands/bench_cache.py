@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'sqlite': 'yatube.cache.SQLiteCache',
+}
+
+
+def run_worker(args):
+    """Читает ключи с распределением Парето, при промахе записывает"""
+    backend, location, worker, ops, keys, seed = args
+    cache = import_string(BACKENDS[backend])(
+        location, {'OPTIONS': {'MAX_ENTRIES': keys * 2}}
+    )
+    rnd = random.Random(seed + worker)
+    payload = 'x' * 2048
+    hits = 0
+    latencies = []
+    for _ in range(ops):
+        key = f'bench:{int(rnd.paretovariate(0.5)) % keys}'
+        started = time.perf_counter()
+        value = cache.get(key)
+        latencies.append(time.perf_counter() - started)
+        if value is None:
+            cache.set(key, payload, 300)
+        else:
+            hits += 1
+    return hits, latencies
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает долю попаданий и задержку кеша '
+            'locmem и sqlite при разном числе воркеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', nargs='+', type=int,
+                            default=[1, 4, 16])
+        parser.add_argument('--ops', type=int, default=20000,
+                            help='запросов на воркер')
+        parser.add_argument('--keys', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(
+            f'{"backend":8} {"workers":>7} {"hit rate":>9} '
+            f'{"p50 us":>8} {"p99 us":>8}'
+        )
+        for workers in options['workers']:
+            for backend in BACKENDS:
+                with tempfile.TemporaryDirectory() as directory:
+                    location = os.path.join(directory, 'cache.sqlite3')
+                    jobs = [
+                        (backend, location, worker, options['ops'],
+                         options['keys'], options['seed'])
+                        for worker in range(workers)
+                    ]
+                    with context.Pool(workers) as pool:
+                        results = pool.map(run_worker, jobs)
+                hits = sum(result[0] for result in results)
+                latencies = [value for result in results
+                             for value in result[1]]
+                quantiles = statistics.quantiles(latencies, n=100)
+                self.stdout.write(
+                    f'{backend:8} {workers:>7} '
+                    f'{hits / len(latencies):>9.1%} '
+                    f'{quantiles[49] * 1e6:>8.1f} '
+                    f'{quantiles[98] * 1e6:>8.1f}'
+                )
@@ -0,0 +1,312 @@
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished
+from django.db import close_old_connections, connections
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.models import Group, Post, Timeline, User
+
+# Доля запросов каждого вида в нагрузке
+MIX = {
+    'index': 30,
+    'index_deep': 5,
+    'follow_index': 20,
+    'profile': 15,
+    'post': 15,
+    'group_posts': 5,
+    'api_posts': 7,
+    'api_comments': 3,
+}
+
+URLS = {
+    'index': lambda rnd, data: reverse('index'),
+    'index_deep': lambda rnd, data: (
+        f'{reverse("index")}?page={rnd.randint(2, 50)}'
+    ),
+    'follow_index': lambda rnd, data: reverse('follow_index'),
+    'profile': lambda rnd, data: reverse(
+        'profile', args=(rnd.choice(data['posts'])[1],)
+    ),
+    'post': lambda rnd, data: post_url(rnd.choice(data['posts'])),
+    'group_posts': lambda rnd, data: reverse(
+        'group_posts', args=(rnd.choice(data['groups']),)
+    ),
+    'api_posts': lambda rnd, data: '/api/v1/posts/',
+    'api_comments': lambda rnd, data: (
+        f'/api/v1/posts/{rnd.choice(data["posts"])[0]}/comments/'
+    ),
+}
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def post_url(post):
+    post_id, username = post
+    return reverse('post', args=(username, post_id))
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100,
+                                method='inclusive')[percent - 1]
+
+
+def call(handler, request):
+    """Выполняет запрос и возвращает статус, заголовки и задержку в мс"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response.update(status=int(status.split()[0]),
+                        headers=dict(headers))
+
+    started = time.perf_counter()
+    body = handler(request, start_response)
+    try:
+        b''.join(body)
+    finally:
+        body.close()
+    elapsed = (time.perf_counter() - started) * 1000
+    return response['status'], response['headers'], elapsed
+
+
+def run_slice(handler, plan):
+    """Выполняет часть прогона в одном потоке, как поток воркера gthread"""
+    try:
+        return [(name, *call(handler, environ(url, cookie)))
+                for name, url, cookie in plan]
+    finally:
+        # Соединения потоков пула, но не основного, закрываются сразу
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def environ(url, cookie):
+    path, _, query = url.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'HTTP_COOKIE': cookie,
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Нагружает приложение через WSGI в этом же процессе и '
+            'сохраняет p50/p95/p99 задержки и число запросов к базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--warmup', type=int, default=100)
+        parser.add_argument('--viewers', type=int, default=20,
+                            help='пользователей, от имени которых идут '
+                                 'запросы')
+        parser.add_argument('--mix', nargs='*', default=[],
+                            help='доли вида name=weight, например index=50')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='потоков, одновременно выполняющих запросы')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='файл JSON с результатами')
+        parser.add_argument('--compare', help='файл JSON прошлого прогона')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        mix = self.parse_mix(options['mix'])
+        data = self.sample(rnd)
+        if not data['groups']:
+            mix.pop('group_posts', None)
+        clients = self.login(options['viewers'])
+        cookies = [self.cookie(client) for client in clients]
+        previous = self.load(options['compare'])
+        timer = logging.getLogger('posts.middleware.server_timing')
+        level = timer.level
+        timer.setLevel(logging.WARNING)
+        # Как в тестовом клиенте: соединение с базой живет весь прогон
+        request_finished.disconnect(close_old_connections)
+        try:
+            with override_settings(SERVER_TIMING_SAMPLE_RATE=1,
+                                   SERVER_TIMING_HEADER=True):
+                results, throughput = self.run(rnd, mix, data, cookies,
+                                               options)
+        finally:
+            request_finished.connect(close_old_connections)
+            timer.setLevel(level)
+            for client in clients:
+                client.logout()
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'options': {name: options[name] for name in
+                        ('requests', 'warmup', 'viewers', 'concurrency',
+                         'seed')},
+            'mix': mix,
+            'throughput': throughput,
+            'views': results,
+        }
+        path = options['output'] or os.path.join(
+            settings.BASE_DIR, 'bench',
+            f'load-{datetime.now():%Y%m%d-%H%M%S}.json'
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as output:
+            json.dump(report, output, indent=2)
+        self.print_report(results, previous and previous['views'])
+        line = (f'Запросов в секунду: {throughput} '
+                f'в {options["concurrency"]} потоках')
+        if previous and previous.get('throughput'):
+            line += f' ({throughput / previous["throughput"] - 1:+.1%})'
+        self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f'Результаты: {path}'))
+
+    def parse_mix(self, items):
+        mix = dict(MIX)
+        for item in items:
+            name, _, weight = item.partition('=')
+            if name not in URLS or not weight.isdigit():
+                raise CommandError(
+                    f'Неверная доля {item!r}, виды: {", ".join(URLS)}'
+                )
+            mix[name] = int(weight)
+        mix = {name: weight for name, weight in mix.items() if weight}
+        if not mix:
+            raise CommandError('Все доли нулевые')
+        return mix
+
+    def sample(self, rnd, size=1000):
+        """Выбирает случайные записи и сообщества для адресов"""
+        bounds = Post.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            raise CommandError('Нет записей, сначала запустите generate_data')
+        ids = [rnd.randint(bounds['first'], bounds['last'])
+               for _ in range(size)]
+        posts = list(Post.objects.filter(pk__in=ids).order_by('pk')
+                     .values_list('pk', 'author__username'))
+        groups = list(Group.objects.order_by('pk')
+                      .values_list('slug', flat=True)[:size])
+        return {'posts': posts, 'groups': groups}
+
+    def login(self, count):
+        """Входит от имени пользователей с собранными лентами подписок"""
+        user_ids = list(Timeline.objects.order_by()
+                        .values_list('user_id', flat=True)
+                        .distinct()[:count])
+        users = list(User.objects.filter(pk__in=user_ids)
+                     or User.objects.order_by('pk')[:count])
+        if not users:
+            raise CommandError('Нет пользователей')
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        return clients
+
+    def cookie(self, client):
+        session = client.cookies[settings.SESSION_COOKIE_NAME]
+        return f'{session.key}={session.value}'
+
+    def load(self, path):
+        if not path:
+            return None
+        try:
+            with open(path) as source:
+                report = json.load(source)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        if 'views' not in report:
+            raise CommandError(f'В {path} нет результатов прогона')
+        return report
+
+    def run(self, rnd, mix, data, cookies, options):
+        """Выполняет прогон, возвращает замеры по видам и запросы в секунду"""
+        handler = WSGIHandler()
+        names, weights = list(mix), list(mix.values())
+        plan = [
+            (name, URLS[name](rnd, data), rnd.choice(cookies))
+            for name in rnd.choices(names, weights,
+                                    k=options['warmup'] + options['requests'])
+        ]
+        run_slice(handler, plan[:options['warmup']])
+        measured = plan[options['warmup']:]
+        threads = options['concurrency']
+        started = time.perf_counter()
+        if threads > 1:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                slices = list(pool.map(partial(run_slice, handler),
+                                       [measured[start::threads]
+                                        for start in range(threads)]))
+        else:
+            # Как синхронный воркер: все запросы в основном потоке
+            slices = [run_slice(handler, measured)]
+        responses = [response for part in slices for response in part]
+        throughput = len(measured) / (time.perf_counter() - started)
+        timings = {name: [] for name in names}
+        queries = {name: [] for name in names}
+        errors = dict.fromkeys(names, 0)
+        for name, status, headers, elapsed in responses:
+            timings[name].append(elapsed)
+            match = QUERIES.search(headers.get('Server-Timing', ''))
+            if match:
+                queries[name].append(int(match.group(1)))
+            if status >= 500:
+                errors[name] += 1
+        results = {
+            name: {
+                'requests': len(values),
+                'errors': errors[name],
+                'p50': round(percentile(values, 50), 2),
+                'p95': round(percentile(values, 95), 2),
+                'p99': round(percentile(values, 99), 2),
+                'queries': round(statistics.mean(queries[name]), 1)
+                if queries[name] else None,
+            }
+            for name, values in timings.items() if values
+        }
+        return results, round(throughput, 1)
+
+    def print_report(self, results, previous):
+        self.stdout.write(
+            f'{"view":14} {"requests":>8} {"errors":>6} {"p50 ms":>8} '
+            f'{"p95 ms":>8} {"p99 ms":>8} {"queries":>7}'
+            + (f' {"p95 diff":>9}' if previous else '')
+        )
+        for name, values in results.items():
+            line = (
+                f'{name:14} {values["requests"]:>8} {values["errors"]:>6} '
+                f'{values["p50"]:>8.2f} {values["p95"]:>8.2f} '
+                f'{values["p99"]:>8.2f} {values["queries"]!s:>7}'
+            )
+            before = (previous or {}).get(name)
+            if before and before['p95']:
+                line += f' {values["p95"] / before["p95"] - 1:>+9.1%}'
+            self.stdout.write(line)
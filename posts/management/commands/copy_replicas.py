@@ -0,0 +1,41 @@
+import os
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from yatube.db_router import replica_aliases
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик '
+            'для локальной проверки чтения с реплик')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='файлы реплик (по умолчанию из DATABASE_REPLICAS)'
+        )
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS]
+        if database.vendor != 'sqlite':
+            raise CommandError('Копирование файлом возможно только для SQLite')
+        paths = options['paths'] or [
+            settings.DATABASES[alias]['NAME'] for alias in replica_aliases()
+        ]
+        if not paths:
+            raise CommandError('Укажите файлы реплик или DATABASE_REPLICAS')
+        primary = os.path.abspath(database.settings_dict['NAME'])
+        if primary in map(os.path.abspath, paths):
+            raise CommandError('Реплика совпадает с основной базой')
+        database.ensure_connection()
+        for path in paths:
+            # Резервная копия SQLite согласована даже при идущих записях
+            target = sqlite3.connect(path)
+            try:
+                database.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'Скопировано в {path}'))
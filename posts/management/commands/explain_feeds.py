@@ -0,0 +1,105 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+
+from posts import generate, ranking
+from posts.models import Post, User
+from posts.paginator import encode_cursor
+
+FEED_TABLES = ('posts_post', 'posts_comment', 'posts_like', 'posts_timeline')
+# Полный проход по таблице (без индекса) или сортировка во временном дереве
+BAD_PLAN = re.compile(r'^SCAN \w+$|USE TEMP B-TREE FOR ORDER BY')
+# Ленты, сливающие несколько диапазонов индекса (подписки на сообщества,
+# лайки): им допустима сортировка отобранных строк, но не полный проход
+MERGED_FEEDS = ('follow_groups', 'liked_posts')
+SCAN_PLAN = re.compile(r'^SCAN \w+$')
+
+
+class Command(BaseCommand):
+    help = ('Проверяет планы запросов лент (EXPLAIN QUERY PLAN) '
+            'на сгенерированных данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Проверка написана для планов SQLite')
+        with transaction.atomic():
+            viewer, post = self.seed(options)
+            connection.cursor().execute('ANALYZE')
+            failures = self.check_views(viewer, post)
+            # Данные и статистика ANALYZE откатываются вместе
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(f'Неудачных планов: {failures}')
+        self.stdout.write(self.style.SUCCESS('Все ленты используют индексы'))
+
+    def seed(self, options):
+        """Создает данные, возвращает зрителя и самую обсуждаемую запись"""
+        data = generate.generate(
+            users=options['users'], posts=options['posts'],
+            likes=options['posts'], comments=options['posts'],
+            timelines=1, seed=options['seed']
+        )
+        ranking.rank()
+        viewer = User.objects.get(pk=data['users'][0])
+        post = (Post.objects.filter(pk__gte=data['posts'][0])
+                .order_by('-num_comments').first())
+        return viewer, post
+
+    def feed_urls(self, viewer, post):
+        last = Post.objects.order_by('-pub_date', '-pk')[100]
+        cursor = encode_cursor(last.pub_date, last.pk)
+        return [
+            (reverse('index'), {}),
+            (reverse('index'), {'page': 50}),
+            (reverse('index'), {'after': cursor}),
+            (reverse('index'), {'before': cursor}),
+            (reverse('popular'), {}),
+            (reverse('popular'), {'page': 20}),
+            (reverse('group_posts', args=(post.group.slug,)), {})
+            if post.group else (reverse('index'), {}),
+            (reverse('profile', args=(post.author.username,)), {}),
+            (reverse('post', args=(post.author.username, post.pk)), {}),
+            (reverse('follow_index'), {}),
+            (reverse('follow_groups'), {}),
+            (reverse('liked_posts'), {}),
+        ]
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
+    }})
+    def check_views(self, viewer, post):
+        """Выполняет ленты и проверяет план каждого их запроса"""
+        factory = RequestFactory()
+        failures = 0
+        for path, params in self.feed_urls(viewer, post):
+            request = factory.get(path, params)
+            request.user = viewer
+            match = resolve(path)
+            bad_plan = (SCAN_PLAN if match.url_name in MERGED_FEEDS
+                        else BAD_PLAN)
+            with CaptureQueriesContext(connection) as context:
+                match.func(request, *match.args, **match.kwargs)
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or not any(
+                        table in sql for table in FEED_TABLES):
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plan = [row[-1] for row in cursor.fetchall()]
+                bad = [step for step in plan if bad_plan.search(step)]
+                if bad:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(
+                        f'{path} {params}: {"; ".join(bad)}\n  {sql}'
+                    ))
+        return failures
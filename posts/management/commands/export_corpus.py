@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = 'Выгружает записи или комментарии в NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(export.KINDS))
+        parser.add_argument('--output', choices=list(export.FORMATS),
+                            default='ndjson')
+        parser.add_argument('--since', help='дата ISO 8601')
+        parser.add_argument('--file', help='файл (по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            since = export.parse_since(options['since'])
+        except ValueError as error:
+            raise CommandError(error)
+        lines = export.stream(options['kind'], options['output'], since)
+        if not options['file']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['file'], 'w', encoding='utf-8',
+                  newline='') as output:
+            output.writelines(lines)
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import generate
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, записями, '
+            'лайками и подписками для нагрузочных проверок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--likes', type=int, default=10000000)
+        parser.add_argument('--comments', type=int, default=1000000)
+        parser.add_argument('--follows', type=int, default=100,
+                            help='подписок на авторов у пользователя')
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--group-follows', type=int, default=5)
+        parser.add_argument('--timelines', type=int, default=100,
+                            help='пользователей с собранной лентой подписок')
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='показатель Ципфа популярности (0 - '
+                                 'равномерно)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            data = generate.generate(
+                users=options['users'], posts=options['posts'],
+                likes=options['likes'], comments=options['comments'],
+                follows=options['follows'], groups=options['groups'],
+                group_follows=options['group_follows'],
+                timelines=options['timelines'], skew=options['skew'],
+                seed=options['seed']
+            )
+        except ValueError as error:
+            raise CommandError(f'{error}, укажите другой --seed')
+        self.stdout.write(self.style.SUCCESS(
+            f'Префикс {data["prefix"]}: пользователей {len(data["users"])}, '
+            f'записей {len(data["posts"])} '
+            f'за {time.perf_counter() - started:.1f} с'
+        ))
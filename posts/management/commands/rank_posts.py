@@ -0,0 +1,38 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import ranking
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг популярных записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=int, default=0,
+            help='повторять каждые столько секунд (0 - один раз)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                ranked = ranking.rank()
+            except Exception:
+                if not options['every']:
+                    raise
+                # Например, база занята запросами сайта: попробуем в
+                # следующий раз, а не остановим пересчет до перезапуска
+                logger.exception('Не удалось пересчитать рейтинг')
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Оценено записей: {ranked}'
+                ))
+            if not options['every']:
+                return
+            close_old_connections()
+            time.sleep(options['every'])
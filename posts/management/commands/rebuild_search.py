@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс записей и комментариев'
+
+    def handle(self, *args, **options):
+        if not search.install() or not search.rebuild():
+            raise CommandError('FTS5 недоступен в этой базе')
+        self.stdout.write(self.style.SUCCESS('Индекс перестроен'))
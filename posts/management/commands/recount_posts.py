@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики лайков и комментариев записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'post_ids', nargs='*', type=int,
+            help='id записей (по умолчанию все записи)'
+        )
+
+    def handle(self, *args, **options):
+        updated = counters.recount(options['post_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано записей: {updated}'
+        ))
@@ -0,0 +1,183 @@
+"""Замеры запроса: SQL, шаблоны и кеш.
+
+Для выбранной доли запросов (SERVER_TIMING_SAMPLE_RATE) считает число
+и время SQL-запросов, время отрисовки шаблонов и попадания в кеш.
+Результат пишется строкой JSON в лог. Заголовок `Server-Timing` с ним
+получает только персонал, а при SERVER_TIMING_HEADER - все клиенты.
+Если задан SERVER_TIMING_AGGREGATE_EVERY, раз в столько запросов к
+одному представлению в лог пишутся средние значения по нему.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache.backends.base import BaseCache
+from django.db import connections
+from django.template.base import Template
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('total', 'db', 'queries', 'template', 'cache_hits', 'cache_misses')
+
+_local = threading.local()
+_lock = threading.Lock()
+_views = defaultdict(lambda: dict.fromkeys(('requests',) + FIELDS, 0))
+_missing = object()
+
+
+class Timings:
+    """Замеры одного запроса"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = self.db = self.template = 0.0
+        self.queries = self.cache_hits = self.cache_misses = 0
+        self.depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def as_dict(self):
+        values = {name: getattr(self, name) for name in FIELDS}
+        for name in ('total', 'db', 'template'):
+            values[name] = round(values[name] * 1000, 2)
+        return values
+
+    def header(self):
+        values = self.as_dict()
+        return ', '.join((
+            f'db;dur={values["db"]};desc="{self.queries} queries"',
+            f'tpl;dur={values["template"]}',
+            f'cache;desc="hit={self.cache_hits} miss={self.cache_misses}"',
+            f'total;dur={values["total"]}',
+        ))
+
+
+def _current():
+    return getattr(_local, 'timings', None)
+
+
+def _timed_render(render):
+    def wrapper(self, context):
+        timings = _current()
+        if timings is None:
+            return render(self, context)
+        # Вложенные include считаются в составе внешнего шаблона
+        timings.depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            timings.depth -= 1
+            if not timings.depth:
+                timings.template += time.perf_counter() - start
+    wrapper.timed = True
+    return wrapper
+
+
+def _counted_get(get):
+    def wrapper(self, key, default=None, version=None):
+        timings = _current()
+        if timings is None:
+            return get(self, key, default, version)
+        value = get(self, key, _missing, version)
+        if value is _missing:
+            timings.cache_misses += 1
+            return default
+        timings.cache_hits += 1
+        return value
+    wrapper.timed = True
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    def wrapper(self, keys, version=None):
+        keys = list(keys)
+        values = get_many(self, keys, version)
+        timings = _current()
+        if timings is not None:
+            timings.cache_hits += len(values)
+            timings.cache_misses += len(keys) - len(values)
+        return values
+    wrapper.timed = True
+    return wrapper
+
+
+def install():
+    """Оборачивает отрисовку шаблонов и чтение из настроенных кешей"""
+    with _lock:
+        if not getattr(Template.render, 'timed', False):
+            Template.render = _timed_render(Template.render)
+        for options in settings.CACHES.values():
+            backend = import_string(options['BACKEND'])
+            if not getattr(backend.get, 'timed', False):
+                backend.get = _counted_get(backend.get)
+            # get_many по умолчанию читает через get и уже посчитан
+            if (backend.get_many is not BaseCache.get_many
+                    and not getattr(backend.get_many, 'timed', False)):
+                backend.get_many = _counted_get_many(backend.get_many)
+
+
+def _aggregate(view, values):
+    every = settings.SERVER_TIMING_AGGREGATE_EVERY
+    if not every:
+        return
+    with _lock:
+        totals = _views[view]
+        totals['requests'] += 1
+        for name in FIELDS:
+            totals[name] += values[name]
+        if totals['requests'] < every:
+            return
+        summary = {name: round(totals[name] / totals['requests'], 2)
+                   for name in FIELDS}
+        summary['requests'] = totals['requests']
+        del _views[view]
+    logger.info(json.dumps({'view': view, 'average': summary}))
+
+
+def server_timing(get_response):
+    install()
+
+    def middleware(request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return get_response(request)
+        timings = _local.timings = Timings()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute)
+                    )
+                response = get_response(request)
+        finally:
+            _local.timings = None
+        timings.finish()
+        user = getattr(request, 'user', None)
+        if settings.SERVER_TIMING_HEADER or (user and user.is_staff):
+            response['Server-Timing'] = timings.header()
+        match = request.resolver_match
+        view = match.view_name if match else None
+        values = timings.as_dict()
+        logger.info(json.dumps({
+            'method': request.method, 'path': request.path, 'view': view,
+            'status': response.status_code, **values,
+        }))
+        _aggregate(view, values)
+        return response
+
+    return middleware
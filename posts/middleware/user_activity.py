@@ -1,12 +1,8 @@
-from datetime import datetime as dt
-from datetime import timedelta as td
+import logging
 
-from django.conf import settings
-from django.utils import timezone
+from .. import activity
 
-from dateutil.parser import parse
-
-from ..models import Activity
+logger = logging.getLogger(__name__)
 
 
 def user_activity(get_response):
@@ -14,18 +10,14 @@ def user_activity(get_response):
     def middleware(request):
 
         response = get_response(request)
-        key = "last-activity"
 
         if request.user.is_authenticated:
-            last_activity = request.session.get(key)
-            too_old_time = (timezone.now()
-                            - td(seconds=settings.LAST_ACTIVITY_INTERVAL_SECS))
-            if not last_activity or parse(last_activity) < too_old_time:
-                seen, created = (Activity.objects
-                                 .get_or_create(user=request.user))
-                seen.time = timezone.now()
-                seen.save()
-            request.session[key] = timezone.now().isoformat()
+            activity.touch(request.user.pk)
+        try:
+            activity.flush_if_due()
+        except Exception:
+            # Ответ уже готов, посещения остались в буфере до следующего раза
+            logger.exception('Не удалось записать посещения')
         return response
 
     return middleware
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.6 on 2026-10-18 14:49
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.annotate(
+        likes=Count('liked', distinct=True),
+        comments_total=Count('comments', distinct=True)
+    )
+    for post in posts.iterator():
+        Post.objects.filter(pk=post.pk).update(
+            num_likes=post.likes, num_comments=post.comments_total
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='num_comments',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='num_likes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество лайков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
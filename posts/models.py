@@ -47,13 +47,70 @@ class Post(models.Model):
         blank=True,
         null=True
     )
+    num_likes = models.PositiveIntegerField(
+        verbose_name='Количество лайков',
+        default=0,
+        editable=False
+    )
+    num_comments = models.PositiveIntegerField(
+        verbose_name='Количество комментариев',
+        default=0,
+        editable=False
+    )
+    version = models.PositiveIntegerField(
+        verbose_name='Версия',
+        default=0,
+        editable=False
+    )
+    score = models.FloatField(
+        verbose_name='Рейтинг',
+        default=0,
+        editable=False
+    )
+    image_variants = models.TextField(
+        verbose_name='Варианты изображения',
+        blank=True,
+        default='',
+        editable=False
+    )
+
+    COUNTER_FIELDS = ('num_likes', 'num_comments')
+    # Поля, которые меняются только отдельными UPDATE, а не через save
+    MANAGED_FIELDS = COUNTER_FIELDS + ('score', 'image_variants')
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        """Сохраняет запись, увеличивая версию при изменении
+
+        Счетчики, рейтинг, варианты картинки и версия меняются только
+        отдельными UPDATE, поэтому при изменении записи они не
+        перезаписываются значениями из экземпляра.
+        """
+        if self._state.adding or kwargs.get('update_fields') is not None:
+            return super().save(*args, **kwargs)
+        self.version = models.F('version') + 1
+        kwargs['update_fields'] = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in self.MANAGED_FIELDS
+        ]
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=self.MANAGED_FIELDS + ('version',))
+
     class Meta:
         """Meta опции"""
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='posts_post_feed_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='posts_post_author_feed_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='posts_post_group_feed_idx'),
+            models.Index(fields=['-score', '-id'],
+                         name='posts_post_score_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -82,6 +139,10 @@ class Comment(models.Model):
     class Meta:
         """Meta опции"""
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='posts_comment_post_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -155,3 +216,33 @@ class Activity(models.Model):
         blank=True,
         null=True
     )
+
+
+class Timeline(models.Model):
+    """Модель Лента подписок
+
+    Материализованная лента: по записи на каждую пару
+    «подписчик — пост автора, на которого он подписан».
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='timeline',
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        related_name='timeline_entries',
+        on_delete=models.CASCADE
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        """Meta опции"""
+        ordering = ['-pub_date', '-id']
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-id'],
+                         name='posts_timeline_feed_idx'),
+        ]
@@ -0,0 +1,119 @@
+"""Курсорный (keyset) паджинатор для лент записей.
+
+Вместо COUNT(*) и OFFSET страница выбирается условием по ключу
+сортировки `(pub_date, id)`, поэтому ее стоимость не зависит от
+глубины листания.
+"""
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(pub_date, pk):
+    value = f'{pub_date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(value).decode()
+
+
+def decode_cursor(cursor):
+    """Возвращает пару (pub_date, id) или None для неверного курсора"""
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        pub_date, pk = value.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage:
+    """Страница курсорного паджинатора"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage {self.start_cursor}:{self.end_cursor}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def start_cursor(self):
+        return self.paginator.cursor_for(self.object_list[0]) if self else ''
+
+    @property
+    def end_cursor(self):
+        return self.paginator.cursor_for(self.object_list[-1]) if self else ''
+
+    def next_cursor(self):
+        """Курсор для перехода к более старым записям"""
+        return self.end_cursor if self._has_next else None
+
+    def previous_cursor(self):
+        """Курсор для перехода к более новым записям"""
+        return self.start_cursor if self._has_previous else None
+
+
+class CursorPaginator:
+    """Паджинатор по ключу `(pub_date, id)` от новых записей к старым"""
+    cursor = True
+
+    def __init__(self, object_list, per_page, date_field='pub_date'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.date_field = date_field
+
+    def cursor_for(self, obj):
+        return encode_cursor(getattr(obj, self.date_field), obj.pk)
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу старше `after` или новее `before`"""
+        field = self.date_field
+        position = decode_cursor(before) if before else None
+        if position:
+            pub_date, pk = position
+            rows = list(
+                self.object_list
+                .filter(Q(**{f'{field}__gt': pub_date})
+                        | Q(**{field: pub_date, 'pk__gt': pk}))
+                .order_by(field, 'pk')[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(rows, self, True, has_previous)
+
+        queryset = self.object_list.order_by(f'-{field}', '-pk')
+        position = decode_cursor(after) if after else None
+        if position:
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': pub_date})
+                | Q(**{field: pub_date, 'pk__lt': pk})
+            )
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return CursorPage(rows[:self.per_page], self, has_next,
+                          position is not None)
@@ -0,0 +1,45 @@
+"""Рейтинг популярных записей.
+
+Оценка записи - сумма лайков и взвешенных комментариев, затухающая с
+возрастом: (likes + COMMENT_WEIGHT * comments) / (hours + 2) ** GRAVITY.
+Она считается по денормализованным счетчикам и хранится в колонке
+`score` с индексом (-score, -id), поэтому вкладка «Популярное» читает
+готовый порядок, ничего не сортируя. Пересчитываются только записи за
+последние RANKING_WINDOW_DAYS дней, более старые выпадают из рейтинга.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Post
+
+# Комментарий требует больше усилий, чем лайк
+COMMENT_WEIGHT = 2
+GRAVITY = 1.8
+BATCH_SIZE = 100
+
+
+def score(num_likes, num_comments, pub_date, now):
+    """Возвращает оценку записи на момент now"""
+    hours = max((now - pub_date).total_seconds() / 3600, 0)
+    return ((num_likes + COMMENT_WEIGHT * num_comments)
+            / (hours + 2) ** GRAVITY)
+
+
+def rank(now=None):
+    """Пересчитывает оценки свежих записей и возвращает их число"""
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=settings.RANKING_WINDOW_DAYS)
+    recent = (Post.objects.filter(pub_date__gte=cutoff).order_by()
+              .values_list('pk', 'num_likes', 'num_comments', 'pub_date'))
+    posts = [
+        Post(pk=pk, score=score(num_likes, num_comments, pub_date, now))
+        for pk, num_likes, num_comments, pub_date in recent.iterator()
+    ]
+    Post.objects.filter(pub_date__lt=cutoff, score__gt=0).update(score=0)
+    # Каждая пачка - своя транзакция, чтобы не держать блокировку записи
+    # в базе на весь пересчет
+    for start in range(0, len(posts), BATCH_SIZE):
+        Post.objects.bulk_update(posts[start:start + BATCH_SIZE], ['score'])
+    return len(posts)
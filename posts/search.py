@@ -0,0 +1,138 @@
+"""Полнотекстовый поиск по записям и комментариям.
+
+На SQLite используется внешний индекс FTS5 поверх таблиц записей и
+комментариев. Индекс обновляется триггерами при создании, изменении и
+удалении строк, а выборка ограничена SEARCH_MAX_RESULTS лучшими по
+bm25 совпадениями. Без FTS5 поиск откатывается на `icontains`.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import (DEFAULT_DB_ALIAS, OperationalError, connection,
+                       connections)
+
+from .models import Comment, Post
+
+logger = logging.getLogger(__name__)
+
+# Совпадение в комментарии весит меньше совпадения в тексте записи
+COMMENT_WEIGHT = 0.5
+MAX_TERMS = 10
+
+INDEXES = {
+    'posts_post_fts': Post._meta.db_table,
+    'posts_comment_fts': Comment._meta.db_table,
+}
+
+TRIGGERS = (
+    'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN '
+    'INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END',
+    'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN '
+    'INSERT INTO {fts}({fts}, rowid, text) '
+    "VALUES ('delete', old.id, old.text); END",
+    'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF text ON {table} '
+    'BEGIN '
+    'INSERT INTO {fts}({fts}, rowid, text) '
+    "VALUES ('delete', old.id, old.text); "
+    'INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END',
+)
+
+_available = None
+
+
+def install(using=None):
+    """Создает индекс и триггеры, если их еще нет.
+
+    Вызывается после каждой миграции: пересоздание таблицы при миграции
+    SQLite удаляет ее триггеры.
+    """
+    global _available
+    database = connections[using or DEFAULT_DB_ALIAS]
+    if database.vendor != 'sqlite':
+        _available = False
+        return False
+    with database.cursor() as cursor:
+        for fts, table in INDEXES.items():
+            exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                'AND name = %s', [fts]
+            ).fetchone()
+            try:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+                    f"text, content='{table}', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                )
+            except OperationalError:
+                logger.warning('FTS5 недоступен, поиск без индекса')
+                _available = False
+                return False
+            for trigger in TRIGGERS:
+                cursor.execute(trigger.format(fts=fts, table=table))
+            if not exists:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    _available = True
+    return True
+
+
+def rebuild():
+    """Перестраивает индекс по текущим записям и комментариям"""
+    if not available():
+        return False
+    with connection.cursor() as cursor:
+        for fts in INDEXES:
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")
+    return True
+
+
+def available():
+    """Есть ли в базе индекс FTS5"""
+    global _available
+    if _available is None:
+        _available = (connection.vendor == 'sqlite' and 'posts_post_fts'
+                      in connection.introspection.table_names())
+    return _available
+
+
+def match_expression(query):
+    """Превращает запрос в выражение FTS5: все слова, последнее по префиксу"""
+    terms = re.findall(r'\w+', query.lower())[:MAX_TERMS]
+    if not terms:
+        return ''
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def _ranked(sql, params):
+    with connection.cursor() as cursor:
+        return cursor.execute(sql, params).fetchall()
+
+
+def search_ids(query, comments=True, limit=None):
+    """Возвращает id записей, подходящих под запрос, от лучших к худшим"""
+    limit = limit or settings.SEARCH_MAX_RESULTS
+    expression = match_expression(query)
+    if not expression:
+        return []
+    if not available():
+        return list(Post.objects.filter(text__icontains=query.strip())
+                    .values_list('pk', flat=True)[:limit])
+    scores = dict(_ranked(
+        'SELECT rowid, rank FROM posts_post_fts '
+        'WHERE posts_post_fts MATCH %s ORDER BY rank LIMIT %s',
+        [expression, limit]
+    ))
+    if comments:
+        for post_id, rank in _ranked(
+            'SELECT comment.post_id, fts.rank FROM posts_comment_fts fts '
+            f'JOIN {Comment._meta.db_table} comment '
+            'ON comment.id = fts.rowid '
+            'WHERE posts_comment_fts MATCH %s ORDER BY fts.rank LIMIT %s',
+            [expression, limit]
+        ):
+            # bm25 отрицателен: чем меньше, тем лучше совпадение
+            rank *= COMMENT_WEIGHT
+            if rank < scores.get(post_id, 0):
+                scores[post_id] = rank
+    return sorted(scores, key=scores.get)[:limit]
@@ -0,0 +1,101 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import counters, likes, live, stats, timeline, versions
+from .models import Comment, Follow, FollowGroup, Group, Like, Post
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    """Раскладывает новую запись по лентам подписчиков"""
+    versions.bump('posts')
+    if created:
+        live.reset()
+        timeline.fan_out(instance)
+        stats.invalidate(instance.author_id)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    """Сбрасывает счетчики профиля автора"""
+    versions.bump('posts')
+    stats.invalidate(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    """Добавляет записи автора в ленту нового подписчика"""
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+        stats.invalidate(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """Убирает записи автора из ленты отписавшегося"""
+    timeline.drop(instance.user_id, instance.author_id)
+    stats.invalidate(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=FollowGroup)
+@receiver(post_delete, sender=FollowGroup)
+def follow_group_changed(sender, instance, **kwargs):
+    """Сбрасывает счетчики профиля при подписке на сообщество"""
+    stats.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    """Увеличивает счетчик лайков записи"""
+    if created:
+        counters.increment(instance.post_id, 'num_likes')
+        likes.forget(instance.user_id, instance.post_id)
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    """Уменьшает счетчик лайков записи"""
+    counters.decrement(instance.post_id, 'num_likes')
+    likes.forget(instance.user_id, instance.post_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    """Увеличивает счетчик комментариев записи"""
+    versions.bump(f'comments:{instance.post_id}')
+    if created:
+        counters.increment(instance.post_id, 'num_comments')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    """Уменьшает счетчик комментариев записи"""
+    versions.bump(f'comments:{instance.post_id}')
+    counters.decrement(instance.post_id, 'num_comments')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """Обновляет версию списка сообществ"""
+    versions.bump('groups')
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    """Обновляет карточки записей переименованного сообщества"""
+    if not created:
+        touch_group_posts(instance)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    """Обновляет карточки до того, как у записей обнулится сообщество"""
+    touch_group_posts(instance)
+
+
+def touch_group_posts(group):
+    """Увеличивает версию записей, в карточках которых видно сообщество"""
+    if Post.objects.filter(group=group).update(version=F('version') + 1):
+        versions.bump('posts')
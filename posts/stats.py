@@ -0,0 +1,61 @@
+"""Счетчики профиля пользователя.
+
+Подписки, подписчики, сообщества и записи автора считаются одним
+запросом с подзапросами и хранятся в кеше до ближайшей подписки,
+отписки или новой записи. Счетчики для кеша читаются из основной базы:
+отстающая реплика оставила бы в нем старые значения на весь срок.
+"""
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import (Count, Exists, IntegerField, OuterRef,
+                              Subquery)
+from django.db.models.functions import Coalesce
+
+from .models import Follow, FollowGroup, Post, User
+
+STATS_TIMEOUT = 60 * 60
+
+COUNTERS = {
+    'following_count': (Follow, 'user'),
+    'follower_count': (Follow, 'author'),
+    'follower_group_count': (FollowGroup, 'user'),
+    'posts_count': (Post, 'author'),
+}
+
+
+def _key(author_id):
+    return f'profile-stats:{author_id}'
+
+
+def _count(model, field):
+    counted = (model.objects.filter(**{field: OuterRef('pk')})
+               .order_by().values(field)
+               .annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def profile_stats(viewer, author):
+    """Возвращает счетчики автора и подписан ли на него пользователь"""
+    check_follow = viewer.is_authenticated and viewer != author
+    follows = False
+    stats = cache.get(_key(author.pk))
+    if stats is None:
+        annotations = {name: _count(model, field)
+                       for name, (model, field) in COUNTERS.items()}
+        if check_follow:
+            annotations['follows'] = Exists(Follow.objects.filter(
+                user=viewer, author=OuterRef('pk')
+            ))
+        stats = (User.objects.using(DEFAULT_DB_ALIAS).filter(pk=author.pk)
+                 .annotate(**annotations)
+                 .values(*annotations).get())
+        follows = stats.pop('follows', False)
+        cache.set(_key(author.pk), stats, STATS_TIMEOUT)
+    elif check_follow:
+        follows = Follow.objects.filter(user=viewer, author=author).exists()
+    return {**stats, 'follows': follows}
+
+
+def invalidate(*user_ids):
+    """Сбрасывает закешированные счетчики пользователей"""
+    cache.delete_many([_key(user_id) for user_id in user_ids])
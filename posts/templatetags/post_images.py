@@ -0,0 +1,11 @@
+from django import template
+
+from posts import images
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/post_picture.html')
+def post_picture(post, sizes=images.CARD_SIZES):
+    """Выводит картинку карточки через <picture> с srcset по форматам"""
+    return images.picture(post, sizes)
@@ -1,12 +1,48 @@
+import gzip
+import json
+import os
+import runpy
+import shutil
+import sqlite3
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import (OperationalError, connection, connections, router,
+                       transaction)
+from django.http import HttpResponse
+from django.templatetags.static import static
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 from PIL import Image
+from sorl.thumbnail import get_thumbnail
+from yatube.cache import SQLiteCache
+from yatube.db_router import PIN_COOKIE, ReplicaRouter, replica_routing
+
+from . import activity, images, likes, ranking, search, stats
+from .forms import PostForm
+from .models import (Activity, Comment, Follow, Group, Like, Post, Timeline,
+                     User)
 
-from .models import Comment, Follow, Group, Post, User
+
+def use_temporary_media(test):
+    """Подменяет MEDIA_ROOT временным каталогом до конца теста"""
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    media = override_settings(MEDIA_ROOT=directory)
+    media.enable()
+    test.addCleanup(media.disable)
 
 
 class Test(TestCase):
@@ -142,6 +178,234 @@ class Test(TestCase):
         self.assertNotIn('post', response.context)
         self.assertTemplateNotUsed(response, 'includes/post_item.html')
 
+    def test_post_card_cache(self):
+        """Тест сброса кеша карточки записи при изменении"""
+        cache.clear()
+        post = Post.objects.create(author=self.user, text=self.text)
+        url = reverse('post', args=(self.user.username, post.id))
+        self.assertContains(self.client.get(url), self.text)
+        self.client.post(
+            reverse('post_edit', args=(self.user.username, post.id)),
+            {'text': 'edited text'}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.version, 1)
+        self.assertContains(self.client.get(url), 'edited text')
+        Comment.objects.create(post=post, author=self.user, text='comment')
+        post.refresh_from_db()
+        self.assertEqual((post.version, post.num_comments), (2, 1))
+
+    def test_post_card_group_change(self):
+        """Тест сброса кеша карточки при изменении сообщества"""
+        cache.clear()
+        post = Post.objects.create(author=self.user, text=self.text,
+                                   group=self.group)
+        url = reverse('post', args=(self.user.username, post.id))
+        self.assertContains(self.client.get(url), '#group')
+        self.group.title = 'renamed'
+        self.group.save()
+        self.assertContains(self.client.get(url), '#renamed')
+        self.group.delete()
+        self.assertNotContains(self.client.get(url), '#renamed')
+        post.refresh_from_db()
+        self.assertEqual((post.version, post.group), (2, None))
+
+    def test_thumbnail_fallback(self):
+        """Тест показа оригинала или старой миниатюры, пока нет вариантов"""
+        use_temporary_media(self)
+        content = BytesIO()
+        Image.new('RGB', (100, 100), color='cyan').save(content, 'JPEG')
+        post = Post.objects.create(
+            author=self.user, text=self.text,
+            image=SimpleUploadedFile('thumb.jpg', content.getvalue())
+        )
+        with mock.patch.object(images.transaction, 'on_commit') as on_commit:
+            self.assertEqual(images.picture(post), {'image': post.image})
+            on_commit.assert_called_once()
+            # Миниатюра sorl, сделанная до вариантов, не отменяет их
+            geometry, options = images.CARD_THUMBNAIL
+            get_thumbnail(post.image, geometry, **options)
+            thumbnail = images.picture(post)['image']
+            self.assertNotEqual(thumbnail.name, post.image.name)
+            self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+            self.assertEqual(on_commit.call_count, 2)
+        self.assertTrue(images.generate(post.id))
+        post.refresh_from_db()
+        self.assertEqual(post.version, 1)
+        self.assertIn('src', images.picture(post))
+
+    def test_image_variants(self):
+        """Тест вариантов картинки разных ширин и форматов в <picture>"""
+        use_temporary_media(self)
+        content = BytesIO()
+        Image.new('RGB', (1200, 600), color='cyan').save(content, 'JPEG')
+        post = Post.objects.create(
+            author=self.user, text=self.text,
+            image=SimpleUploadedFile('wide.jpg', content.getvalue())
+        )
+        with override_settings(POST_IMAGE_FORMATS=('webp', 'jpeg')):
+            self.assertTrue(images.generate(post.id))
+        post.refresh_from_db()
+        variants = json.loads(post.image_variants)
+        self.assertEqual(variants['source'], post.image.name)
+        self.assertEqual(list(variants['formats']), ['webp', 'jpeg'])
+        name, width, height = variants['formats']['webp'][-1]
+        self.assertEqual((width, height), (960, 339))
+        self.assertEqual(len(variants['formats']['webp']), 2)
+        with post.image.storage.open(name) as source:
+            self.assertEqual(Image.open(source).format, 'WEBP')
+        cache.clear()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f'{post.image.storage.url(name)} 960w')
+        post.image = SimpleUploadedFile('new.jpg', content.getvalue())
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants, json.dumps(variants))
+        self.assertNotIn('sources', images.picture(post))
+        output = StringIO()
+        with override_settings(POST_IMAGE_FORMATS=('webp', 'jpeg')):
+            call_command('backfill_images', stdout=output)
+            call_command('backfill_images', stdout=output)
+        self.assertIn('Обработано записей: 1', output.getvalue())
+        self.assertIn('Обработано записей: 0', output.getvalue())
+        post.refresh_from_db()
+        self.assertIn('sources', images.picture(post))
+        self.assertFalse(post.image.storage.exists(name))
+
+    def test_image_crop(self):
+        """Тест фоновой обрезки и уменьшения картинки"""
+        use_temporary_media(self)
+        content = BytesIO()
+        Image.new('RGB', (400, 300), color='cyan').save(content, 'JPEG')
+        data = {
+            'text': self.text,
+            'image': SimpleUploadedFile('crop.jpg', content.getvalue()),
+            'crop_data': '{"x": 10, "y": 20, "width": 300, "height": 100}',
+        }
+        form = PostForm(data, files={'image': data.pop('image')})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['crop_data'], (10, 20, 310, 120))
+        post = form.save()
+        post.author = self.user
+        post.save()
+        with override_settings(POST_IMAGE_MAX_SIDE=150):
+            self.assertTrue(images.prepare(post.id, (10, 20, 310, 120)))
+        post.refresh_from_db()
+        self.assertEqual((post.image.width, post.image.height), (150, 50))
+        form = PostForm({'text': self.text, 'crop_data': '{"x": -1}'})
+        self.assertIn('crop_data', form.errors)
+
+    def test_image_orientation(self):
+        """Тест поворота снимка по EXIF и сохранения MPO как JPEG"""
+        exif = Image.Exif()
+        exif[images.EXIF_ORIENTATION] = 6
+        content = BytesIO()
+        Image.new('RGB', (400, 300), color='cyan').save(
+            content, 'JPEG', exif=exif.tobytes()
+        )
+        content.seek(0)
+        target = BytesIO()
+        self.assertEqual(images.crop_file(content, target, None, 2048),
+                         (300, 400))
+        # Старая картинка без обработки: варианты тоже строятся по
+        # повернутому снимку, верхняя половина которого красная
+        image = Image.new('RGB', (1200, 600), color='blue')
+        image.paste('red', (0, 0, 600, 600))
+        content = BytesIO()
+        image.save(content, 'JPEG', exif=exif.tobytes())
+        content.seek(0)
+        rendered = images.render_variants(content, (480, 960), ['jpeg'])
+        self.assertEqual([item[1:3] for item in rendered], [(480, 170)])
+        variant = Image.open(BytesIO(rendered[0][3]))
+        self.assertGreater(variant.getpixel((240, 10))[0], 200)
+        self.assertGreater(variant.getpixel((240, 160))[2], 200)
+        content = BytesIO()
+        Image.new('RGB', (400, 300), color='cyan').save(content, 'MPO')
+        content.seek(0)
+        target = BytesIO()
+        images.crop_file(content, target, (0, 0, 200, 100), 2048)
+        target.seek(0)
+        self.assertEqual(Image.open(target).format, 'JPEG')
+
+    def test_image_failure(self):
+        """Тест отказа от повторной обработки картинки после ошибки"""
+        self.addCleanup(cache.clear)
+        post = Post.objects.create(
+            author=self.user, text=self.text, image='posts/broken.jpg'
+        )
+        failing = mock.patch.object(images, 'process',
+                                    side_effect=OSError('broken'))
+        with failing, override_settings(POST_IMAGE_WORKERS=0), \
+                self.assertLogs('posts.images', 'ERROR'):
+            images._submit(post.id)
+        with mock.patch.object(images.transaction, 'on_commit') as on_commit:
+            self.assertEqual(images.picture(post), {'image': post.image})
+            on_commit.assert_not_called()
+            post.text = 'edited'
+            post.save()
+            images.schedule(post)
+            on_commit.assert_called_once()
+
+    def test_search(self):
+        """Тест полнотекстового поиска по записям и комментариям"""
+        post = Post.objects.create(author=self.user, text='Кошки спят днем')
+        other = Post.objects.create(author=self.user, text='Собаки гуляют')
+        self.assertEqual(search.search_ids('кошки'), [post.id])
+        self.assertEqual(search.search_ids('кош'), [post.id])
+        Comment.objects.create(post=other, author=self.user,
+                               text='Кошки тоже гуляют')
+        self.assertEqual(search.search_ids('кошки'), [post.id, other.id])
+        post.text = 'Кошки и собаки'
+        post.save()
+        self.assertCountEqual(search.search_ids('собаки', comments=False),
+                              [post.id, other.id])
+        other.delete()
+        self.assertEqual(search.search_ids('гуляют'), [])
+        response = self.client.get(reverse('search'), {'q': 'кошки'})
+        self.assertEqual(list(response.context['page']), [post])
+        response = self.client.get('/api/v1/posts/', {'search': 'кошки'})
+        self.assertEqual(
+            [item['id'] for item in response.json()['results']], [post.id]
+        )
+
+    def test_activity(self):
+        """Тест отложенной записи последнего посещения"""
+        cache.clear()
+        activity.flush()
+        Activity.objects.all().delete()
+        self.client.get(reverse('groups_overview'))
+        self.assertFalse(Activity.objects.exists())
+        seen = activity.last_seen(self.user)
+        self.assertIsNotNone(seen)
+        self.assertEqual(activity.flush(), 1)
+        self.assertEqual(Activity.objects.get(user=self.user).time, seen)
+
+    def test_worker_exit(self):
+        """Тест записи буфера посещений при выходе воркера gunicorn"""
+        activity.flush()
+        Activity.objects.all().delete()
+        activity.touch(self.user.pk)
+        config = runpy.run_path(
+            os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')
+        )
+        config['worker_exit'](mock.Mock(), mock.Mock())
+        self.assertTrue(Activity.objects.filter(user=self.user).exists())
+
+    def test_activity_flush_error(self):
+        """Тест сохранения буфера посещений при ошибке записи"""
+        activity.flush()
+        Activity.objects.all().delete()
+        failing = mock.patch.object(activity, '_write',
+                                    side_effect=OperationalError('locked'))
+        with failing, override_settings(ACTIVITY_FLUSH_INTERVAL_SECS=0), \
+                self.assertLogs('posts.middleware.user_activity', 'ERROR'):
+            response = self.client.get(reverse('groups_overview'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(activity.flush(), 1)
+        self.assertTrue(Activity.objects.filter(user=self.user).exists())
+
     def test_404(self):
         """Тест несуществующей страницы"""
         response = self.client.get('/404/')
@@ -186,6 +450,32 @@ class TestComment(TestCase):
         self.assertEqual(Comment.objects.count(), 0)
         self.assertTemplateUsed(response, 'registration/login.html')
 
+    def test_comment_counter(self):
+        """Тест счетчика комментариев"""
+        self.client.post(
+            reverse('add_comment', args=(self.user.username, self.post.id)),
+            {'text': self.text}
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.num_comments, 1)
+        comment = Comment.objects.get()
+        self.client.get(reverse(
+            'del_comment',
+            args=(self.user.username, self.post.id, comment.id)
+        ))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.num_comments, 0)
+
+    def test_recount(self):
+        """Тест пересчета счетчиков"""
+        Like.objects.create(user=self.user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(num_likes=5,
+                                                    num_comments=3)
+        call_command('recount_posts', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.num_likes, 1)
+        self.assertEqual(self.post.num_comments, 0)
+
 
 class TestFollow(TestCase):
     """Тестирование системы подписки"""
@@ -241,6 +531,20 @@ class TestFollow(TestCase):
         self.assertIn('post', response.context)
         self.assertEqual(response.context['post'].text, post.text)
 
+    def test_follow_index_queries(self):
+        """Тест числа запросов ленты подписок, не зависящего от страницы"""
+        Follow.objects.create(user=self.follower, author=self.following)
+        Post.objects.create(author=self.following, text=self.text)
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('follow_index'))
+        for _ in range(9):
+            Post.objects.create(author=self.following, text=self.text)
+        cache.clear()
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = self.client.get(reverse('follow_index'))
+        self.assertEqual(len(response.context['page']), 10)
+
     def test_new_post_not_follower(self):
         """Тест отображения для не подписчика"""
         Post.objects.create(
@@ -255,3 +559,495 @@ class TestFollow(TestCase):
         self.client.force_login(user)
         response = self.client.get(reverse('follow_index'))
         self.assertNotIn('post', response.context)
+
+    def test_profile_stats(self):
+        """Тест счетчиков профиля"""
+        cache.clear()
+        Post.objects.create(author=self.following, text=self.text)
+        with self.assertNumQueries(1):
+            follow = stats.profile_stats(self.follower, self.following)
+        self.assertEqual(
+            (follow['follower_count'], follow['posts_count'],
+             follow['follows']),
+            (0, 1, False)
+        )
+        Follow.objects.create(user=self.follower, author=self.following)
+        follow = stats.profile_stats(self.follower, self.following)
+        self.assertEqual((follow['follower_count'], follow['follows']),
+                         (1, True))
+        with self.assertNumQueries(1):
+            stats.profile_stats(self.follower, self.following)
+
+    def test_timeline(self):
+        """Тест наполнения ленты подписок"""
+        old_post = Post.objects.create(author=self.following, text=self.text)
+        self.client.get(
+            reverse('profile_follow', args=(self.following.username,))
+        )
+        new_post = Post.objects.create(author=self.following, text=self.text)
+        self.assertEqual(
+            list(self.follower.timeline.values_list('post_id', flat=True)),
+            [new_post.id, old_post.id]
+        )
+        response = self.client.get(reverse('follow_index'))
+        self.assertEqual(len(response.context['page']), 2)
+        self.client.get(
+            reverse('profile_unfollow', args=(self.following.username,))
+        )
+        self.assertFalse(Timeline.objects.exists())
+
+
+class TestLike(TransactionTestCase):
+    """Тестирование лайков"""
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='test_user')
+        self.post = Post.objects.create(author=self.user, text='post_text')
+        self.client.force_login(self.user)
+
+    def test_like(self):
+        """Тест отметки лайкнутых записей"""
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.context['page'][0].is_liked)
+        response = self.client.post(reverse('post_like'),
+                                    {'post_id': self.post.id})
+        self.assertEqual(response.json()['likes'], [
+            {'post_id': self.post.id, 'is_liked': True, 'num_likes': 1}
+        ])
+        response = self.client.get(
+            reverse('post', args=(self.user.username, self.post.id))
+        )
+        self.assertTrue(response.context['post'].is_liked)
+        self.client.post(reverse('post_like'),
+                         {'post_id': self.post.id, 'liked': 'false'})
+        response = self.client.get(reverse('liked_posts'))
+        self.assertEqual(len(response.context['page']), 0)
+        response = self.client.get(
+            reverse('post', args=(self.user.username, self.post.id))
+        )
+        self.assertFalse(response.context['post'].is_liked)
+
+    def test_like_rollback(self):
+        """Тест отметки лайка после отката транзакции"""
+        self.assertEqual(likes.liked_ids(self.user, [self.post.id]), set())
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Like.objects.create(user=self.user, post=self.post)
+            raise RuntimeError
+        self.assertEqual(likes.liked_ids(self.user, [self.post.id]), set())
+        Like.objects.create(user=self.user, post=self.post)
+        self.assertEqual(likes.liked_ids(self.user, [self.post.id]),
+                         {self.post.id})
+
+    def test_like_batch(self):
+        """Тест пачки нажатий и идемпотентности лайка"""
+        other = Post.objects.create(author=self.user, text='other')
+        Like.objects.create(user=self.user, post=other)
+        Post.objects.filter(pk=other.pk).update(num_likes=7)
+        self.assertEqual(likes.liked_ids(self.user, [self.post.id, other.id]),
+                         {other.id})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                reverse('post_like'), content_type='application/json',
+                data={'likes': [
+                    {'post_id': self.post.id, 'liked': True},
+                    {'post_id': self.post.id, 'liked': True},
+                    {'post_id': other.id},
+                ]}
+            )
+        # Счетчики меняются на единицу, а не пересчитываются по лайкам
+        self.assertEqual(response.json()['likes'], [
+            {'post_id': self.post.id, 'is_liked': True, 'num_likes': 1},
+            {'post_id': other.id, 'is_liked': False, 'num_likes': 6},
+        ])
+        self.assertFalse([query for query in context.captured_queries
+                          if 'COUNT(' in query['sql']
+                          and 'posts_like' in query['sql']])
+        self.assertEqual(likes.liked_ids(self.user, [self.post.id, other.id]),
+                         {self.post.id})
+        response = self.client.post(
+            reverse('post_like'), content_type='application/json',
+            data={'likes': [{'post_id': self.post.id, 'liked': True}]}
+        )
+        self.assertEqual(response.json()['likes'][0]['num_likes'], 1)
+        self.assertEqual(
+            self.client.get(reverse('post_like')).status_code, 405
+        )
+        response = self.client.post(reverse('post_like'), {'post_id': 0})
+        self.assertEqual(response.status_code, 404)
+        for liked in (1, 'yes', [True]):
+            response = self.client.post(
+                reverse('post_like'), content_type='application/json',
+                data={'likes': [{'post_id': self.post.id, 'liked': liked}]}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_like_conflict(self):
+        """Лайк, вставленный параллельно после чтения, не считается"""
+        insert = likes._insert
+
+        def concurrent_insert(user_id, post_id):
+            Like.objects.bulk_create([Like(user_id=user_id, post_id=post_id)])
+            return insert(user_id, post_id)
+
+        with mock.patch('posts.likes._insert', side_effect=concurrent_insert):
+            counts = likes.set_likes(self.user, {self.post.id: True})
+        self.assertEqual(counts, {self.post.id: 0})
+        self.assertEqual(Like.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(likes.liked_ids(self.user, [self.post.id]),
+                         {self.post.id})
+
+
+class TestNewPosts(TransactionTestCase):
+    """Тестирование опроса новых записей"""
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='test_user')
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(title='group', slug='group')
+        Follow.objects.create(user=self.user, author=self.author)
+        self.first = Post.objects.create(author=self.author, text='first')
+        self.client.force_login(self.user)
+
+    def poll(self, **params):
+        return self.client.get(reverse('new_posts'), params).json()
+
+    def test_new_posts(self):
+        """Тест числа, id и карточек новых записей лент"""
+        since = self.first.pk
+        self.assertEqual(self.poll(since=since), {'count': 0, 'ids': []})
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('new_posts'), {'since': since})
+        self.assertFalse([query for query in context
+                          if 'posts_' in query['sql']])
+        grouped = Post.objects.create(author=self.user, text='grouped',
+                                      group=self.group)
+        followed = Post.objects.create(author=self.author, text='followed')
+        self.assertEqual(self.poll(since=since)['ids'],
+                         [followed.pk, grouped.pk])
+        self.assertEqual(self.poll(since=since, feed='group',
+                                   group='group')['ids'], [grouped.pk])
+        data = self.poll(since=since, feed='follow', cards=1)
+        self.assertEqual(data, {'count': 1, 'ids': [followed.pk],
+                                'html': data['html']})
+        self.assertIn(f'data-post="{followed.pk}"', data['html'])
+        self.assertEqual(
+            self.client.get(reverse('new_posts'), {'since': 'x'})
+            .status_code, 400
+        )
+        self.assertEqual(
+            self.client.get(reverse('new_posts'),
+                            {'since': since, 'feed': 'group'}).status_code,
+            400
+        )
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, f'data-since="{followed.pk}"')
+
+
+class TestRanking(TestCase):
+    """Тестирование рейтинга популярных записей"""
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.old, self.liked, self.commented, self.quiet = [
+            Post.objects.create(author=self.user, text=text)
+            for text in ('old', 'liked', 'commented', 'quiet')
+        ]
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=timezone.now() - timedelta(days=30), score=5
+        )
+        for number in range(3):
+            reader = User.objects.create_user(username=f'reader_{number}')
+            Like.objects.create(user=reader, post=self.liked)
+            Like.objects.create(user=reader, post=self.old)
+        for text in ('first', 'second'):
+            Comment.objects.create(post=self.commented, author=self.user,
+                                   text=text)
+
+    def test_rank(self):
+        """Тест оценок и порядка вкладки популярных записей"""
+        self.assertEqual(ranking.rank(), 3)
+        scores = dict(Post.objects.values_list('text', 'score'))
+        self.assertEqual(scores['old'], 0)
+        self.assertEqual(scores['quiet'], 0)
+        self.assertGreater(scores['commented'], scores['liked'])
+        page = self.client.get(reverse('popular')).context['page']
+        self.assertEqual(list(page), [self.commented, self.liked])
+        self.liked.text = 'edited'
+        self.liked.save()
+        self.liked.refresh_from_db()
+        self.assertEqual(self.liked.score, scores['liked'])
+
+    def test_rank_posts_retry(self):
+        """Тест продолжения пересчета после ошибки базы"""
+        rank = mock.patch.object(ranking, 'rank', side_effect=[
+            OperationalError('database is locked'), 3
+        ])
+        # Второй сон прерывает бесконечный цикл команды
+        sleep = mock.patch('time.sleep', side_effect=[None, KeyboardInterrupt])
+        output = StringIO()
+        with rank, sleep, self.assertRaises(KeyboardInterrupt), \
+                self.assertLogs('posts.management.commands.rank_posts'):
+            call_command('rank_posts', every=300, stdout=output)
+        self.assertIn('Оценено записей: 3', output.getvalue())
+
+
+@override_settings(CURSOR_PAGINATION=True, CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+})
+class TestCursorPaginator(TestCase):
+    """Тестирование курсорной паджинации"""
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'post {i}') for i in range(15)
+        )
+
+    def test_pages(self):
+        """Тест перехода к старым и новым записям"""
+        posts = list(Post.objects.order_by('-pub_date', '-id'))
+        page = self.client.get(reverse('index')).context['page']
+        self.assertEqual(list(page), posts[:10])
+        self.assertFalse(page.has_previous())
+        page = self.client.get(
+            reverse('index'), {'after': page.next_cursor()}
+        ).context['page']
+        self.assertEqual(list(page), posts[10:])
+        self.assertFalse(page.has_next())
+        page = self.client.get(
+            reverse('index'), {'before': page.previous_cursor()}
+        ).context['page']
+        self.assertEqual(list(page), posts[:10])
+        self.assertFalse(page.has_previous())
+
+
+class TestQueryPlans(TestCase):
+    """Тестирование планов запросов лент"""
+    def test_explain_feeds(self):
+        """Ленты читаются по индексам, без полного прохода и сортировки"""
+        output = StringIO()
+        call_command('explain_feeds', posts=2000, users=50, stdout=output)
+        self.assertIn('Все ленты используют индексы', output.getvalue())
+        self.assertFalse(Post.objects.exists())
+
+    def test_generate_and_bench(self):
+        """Тест генерации данных и нагрузочного прогона"""
+        call_command('generate_data', users=30, posts=300, likes=600,
+                     comments=100, follows=5, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(
+            Post.objects.filter(num_likes__gt=0).count(),
+            Like.objects.values('post').distinct().count()
+        )
+        self.assertTrue(Timeline.objects.exists())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            call_command('bench_load', requests=40, warmup=2, output=path,
+                         stdout=StringIO())
+            with open(path) as source:
+                views = json.load(source)['views']
+        self.assertEqual(sum(view['requests'] for view in views.values()),
+                         40)
+        self.assertFalse(any(view['errors'] for view in views.values()))
+        self.assertGreater(views['index']['queries'], 0)
+
+
+@override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+class TestServerTiming(TestCase):
+    """Тестирование замеров запроса"""
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='test_user')
+        Post.objects.create(author=self.user, text='post')
+
+    def test_header(self):
+        """Тест заголовка Server-Timing и строки в логе"""
+        logger = 'posts.middleware.server_timing'
+        with self.assertLogs(logger):
+            response = self.client.get(reverse('index'))
+        self.assertNotIn('Server-Timing', response)
+        cache.clear()
+        self.client.force_login(
+            User.objects.create_user(username='staff', is_staff=True)
+        )
+        with self.assertLogs(logger) as logs:
+            response = self.client.get(reverse('index'))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(header, r'tpl;dur=[\d.]+')
+        self.assertIn('cache;desc="hit=', header)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'index')
+        self.assertGreater(line['queries'], 0)
+        self.assertGreater(line['cache_misses'], 0)
+        with self.assertLogs(logger) as logs:
+            self.client.get(reverse('index'))
+        self.assertGreater(json.loads(logs.records[0].getMessage())
+                           ['cache_hits'], 0)
+        with override_settings(SERVER_TIMING_SAMPLE_RATE=0):
+            self.assertNotIn('Server-Timing',
+                             self.client.get(reverse('index')))
+
+    @override_settings(SERVER_TIMING_AGGREGATE_EVERY=2)
+    def test_aggregate(self):
+        """Тест средних значений по представлению"""
+        with self.assertLogs('posts.middleware.server_timing') as logs:
+            self.client.get(reverse('index'))
+            self.client.get(reverse('index'))
+        summary = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(summary['view'], 'index')
+        self.assertEqual(summary['average']['requests'], 2)
+
+
+class TestSQLiteCache(TestCase):
+    """Тестирование общего кеша на SQLite"""
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SQLiteCache(
+            os.path.join(directory.name, 'cache.sqlite3'), {}
+        )
+
+    def test_get_set(self):
+        """Тест записи, добавления и удаления"""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('expired', 1, -1)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertTrue(self.cache.add('expired', 2))
+
+    def test_incr(self):
+        """Тест атомарного увеличения и версий ключей"""
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.assertEqual(self.cache.incr_version('counter'), 2)
+        self.assertEqual(self.cache.get('counter', version=2), 6)
+        self.assertIsNone(self.cache.get('counter'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_errors(self):
+        """Тест промахов вместо ошибок, когда файл кеша недоступен"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Каталог вместо файла: SQLite не может открыть базу
+        broken = SQLiteCache(directory.name, {})
+        with self.assertLogs('yatube.cache', 'ERROR'):
+            self.assertEqual(broken.get('key', 'default'), 'default')
+            broken.set('key', 1)
+            self.assertFalse(broken.add('key', 1))
+            self.assertEqual(broken.get_many(['key']), {})
+            broken.delete('key')
+            with self.assertRaises(ValueError):
+                broken.incr('key')
+
+
+class TestReplicaRouter(TestCase):
+    """Тестирование чтения с реплик"""
+    def setUp(self):
+        self.router = ReplicaRouter(['replica_0'])
+        self.factory = RequestFactory()
+
+    def route(self, request, write=False):
+        reads = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Post)
+            reads.append(self.router.db_for_read(Post))
+            reads.append(self.router.db_for_read(Session))
+            return HttpResponse()
+
+        response = replica_routing(view)(request)
+        return reads, PIN_COOKIE in response.cookies
+
+    def test_routing(self):
+        """Тест выбора базы для чтения и закрепления за основной"""
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertEqual(self.route(self.factory.get('/')),
+                         (['replica_0', 'default'], False))
+        self.assertEqual(self.route(self.factory.get('/'), write=True),
+                         (['default', 'default'], True))
+        self.assertEqual(self.route(self.factory.post('/')),
+                         (['default', 'default'], True))
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.route(request), (['default', 'default'], False))
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+
+class TestCopyReplicas(TransactionTestCase):
+    """Тестирование копий базы для реплик"""
+    def test_copy_replicas(self):
+        """Тест копии основной базы в файл реплики"""
+        Post.objects.create(
+            author=User.objects.create_user(username='test_user'),
+            text='post'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'replica.sqlite3')
+            call_command('copy_replicas', path, stdout=StringIO())
+            replica = sqlite3.connect(path)
+            count = replica.execute('SELECT COUNT(*) FROM posts_post')
+            self.assertEqual(count.fetchone(), (1,))
+            replica.close()
+
+
+class TestReplicaCache(TransactionTestCase):
+    """Тестирование кешей при отстающей реплике"""
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        Post.objects.create(author=self.author, text='first')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'replica.sqlite3')
+        call_command('copy_replicas', path, stdout=StringIO())
+        connections.databases['replica_0'] = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': path,
+        }
+        connections.ensure_defaults('replica_0')
+        self.addCleanup(connections.databases.pop, 'replica_0')
+        self.addCleanup(connections['replica_0'].close)
+        replicas = mock.patch.object(router.routers[0], 'replicas',
+                                     ['replica_0'])
+        replicas.start()
+        self.addCleanup(replicas.stop)
+
+    def test_profile_stats_after_pin(self):
+        """Тест свежих счетчиков профиля после окончания закрепления"""
+        self.client.force_login(self.author)
+        self.client.post(reverse('new_post'), {'text': 'second'})
+        self.assertIn(PIN_COOKIE, self.client.cookies)
+        # Закрепление истекло, а реплика еще не получила новую запись
+        del self.client.cookies[PIN_COOKIE]
+        url = reverse('profile', args=(self.author.username,))
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['page']), 1)
+        self.assertEqual(response.context['follow']['posts_count'], 2)
+        response = self.client.get(url)
+        self.assertEqual(response.context['follow']['posts_count'], 2)
+
+
+class TestStaticFiles(TestCase):
+    """Тестирование сборки статики"""
+    def test_collectstatic(self):
+        """Тест имен с хешем и сжатых копий"""
+        self.assertEqual(static('jquery/dist/jquery.min.js'),
+                         '/static/jquery/dist/jquery.min.js')
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(STATIC_ROOT=directory):
+                call_command('collectstatic', interactive=False,
+                             verbosity=0)
+                name = static('jquery/dist/jquery.min.js')
+                self.assertRegex(
+                    name, r'^/static/jquery/dist/jquery\.min\.\w{12}\.js$'
+                )
+                path = os.path.join(directory, name[len('/static/'):])
+                with open(path, 'rb') as source:
+                    data = source.read()
+                with gzip.open(path + '.gz') as source:
+                    self.assertEqual(source.read(), data)
+                with self.assertRaises(ValueError):
+                    static('missing.js')
@@ -0,0 +1,66 @@
+"""Материализованная лента подписок.
+
+Лента заполняется при публикации записи (fan-out on write) и
+согласуется при подписке и отписке, поэтому `follow_index` читает
+один отсортированный срез id независимо от числа авторов.
+"""
+from collections import defaultdict
+
+from .models import Follow, Post, Timeline
+
+BATCH_SIZE = 500
+
+
+def _bulk_insert(entries):
+    Timeline.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def fan_out(post):
+    """Добавляет запись в ленты всех подписчиков автора"""
+    fan_out_many([post])
+
+
+def fan_out_many(posts):
+    """Добавляет пачку записей в ленты подписчиков их авторов"""
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    for author_id, author_posts in by_author.items():
+        followers = (Follow.objects.filter(author_id=author_id)
+                     .values_list('user_id', flat=True))
+        _bulk_insert([
+            Timeline(user_id=user_id, post_id=post.pk,
+                     pub_date=post.pub_date)
+            for user_id in followers.iterator() for post in author_posts
+        ])
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя все записи автора"""
+    posts = (Post.objects.filter(author_id=author_id)
+             .values_list('pk', 'pub_date'))
+    _bulk_insert([
+        Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts.iterator()
+    ])
+
+
+def drop(user_id, author_id):
+    """Убирает из ленты пользователя записи автора"""
+    (Timeline.objects
+     .filter(user_id=user_id, post__author_id=author_id)
+     .delete())
+
+
+def rebuild(user_ids=None):
+    """Пересобирает ленты с нуля по текущим подпискам"""
+    entries = Timeline.objects.all()
+    follows = Follow.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    entries.delete()
+    for user_id, author_id in follows.values_list('user_id', 'author_id'):
+        backfill(user_id, author_id)
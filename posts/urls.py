@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('popular/', views.popular, name='popular'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
 
     path('groups/follow/', views.follow_groups, name='follow_groups'),
@@ -16,8 +17,9 @@ urlpatterns = [
     path('new/', views.new_post, name='new_post'),
     path('follow/', views.follow_index, name='follow_index'),
     path('like/', views.post_like, name='post_like'),
-    path('removelike/', views.post_remove_like, name='post_remove_like'),
     path('liked/', views.liked_posts, name='liked_posts'),
+    path('search/', views.post_search, name='search'),
+    path('new-posts/', views.new_posts, name='new_posts'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path('<str:username>/<int:post_id>/edit/',
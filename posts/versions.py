@@ -0,0 +1,37 @@
+"""Версии коллекций для условных запросов.
+
+Версия коллекции - время последнего изменения в наносекундах. Она
+хранится в кеше и обновляется сигналами при изменении записей,
+комментариев и сообществ. Из нее API строит ETag и Last-Modified, не
+выполняя запросов к базе и не сериализуя ответ. Версии в кеше
+отдельного процесса (LocMemCache) не видят изменений из других
+воркеров, поэтому на них условные ответы не строятся.
+"""
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def _key(name):
+    return f'collection-version:{name}'
+
+
+def get(name):
+    """Возвращает версию коллекции, заводя ее при первом обращении"""
+    version = cache.get(_key(name))
+    if version is None:
+        cache.add(_key(name), time.time_ns(), None)
+        version = cache.get(_key(name), time.time_ns())
+    return version
+
+
+def bump(*names):
+    """Отмечает изменение коллекций"""
+    now = time.time_ns()
+    cache.set_many({_key(name): now for name in names}, None)
+
+
+def shared():
+    """Видят ли версии все процессы: кеш общий, а не в памяти воркера"""
+    return not isinstance(caches['default'], LocMemCache)
@@ -1,54 +1,55 @@
 
 import json
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.paginator import Paginator
-from django.db.models import Count, Exists, OuterRef
-from django.http import HttpResponse, JsonResponse
+from django.db.models import Exists, OuterRef
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         JsonResponse)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.urls import reverse
+from django.views.decorators.http import require_POST
 # from django.utils.text import slugify
 from PIL import Image
 from pytils.translit import slugify
 
+from . import activity, images, likes, live, search, stats
 from .forms import CommentForm, GroupForm, PostForm
-from .models import (Activity, Comment, Follow, FollowGroup, Group, Like, Post,
-                     User)
+from .models import Comment, Follow, FollowGroup, Group, Post, Timeline, User
+from .paginator import CursorPaginator
 
 
 def set_paginator(request, posts, pages):
     """Настройка паджинатора"""
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if settings.CURSOR_PAGINATION or after or before:
+        paginator = CursorPaginator(posts, pages)
+        return paginator, paginator.get_page(after, before)
     paginator = Paginator(posts, pages)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     return paginator, page
 
 
-def follow_count(user, author):
-    following_count = Follow.objects.filter(user=author).count()
-    foll_list = Follow.objects.filter(author=author)
-    follows = foll_list.filter(user=user) if user.is_authenticated else None
-    follower_count = foll_list.count()
-    follower_group_count = FollowGroup.objects.filter(user=author).count()
-    return {
-        'follows': follows,
-        'follower_count': follower_count,
-        'following_count': following_count,
-        'follower_group_count': follower_group_count
-    }
-
-
-def post_annotate(request, post_list):
-    like_exist = (Like.objects.filter(
-        post=OuterRef('pk'),
-        user=request.user.is_authenticated and request.user
-    ))
-    return (post_list
-            .annotate(num_likes=Count('liked', distinct=True))
-            .annotate(is_liked=Exists(like_exist))
-            .annotate(num_comments=Count('comments', distinct=True)))
+def post_annotate(request, page):
+    """Отмечает записи страницы, лайкнутые пользователем"""
+    page.object_list = likes.mark_liked(request.user, list(page.object_list))
+    return page
+
+
+def timeline_posts(request, post_ids):
+    """Возвращает записи ленты в порядке среза id"""
+    post_ids = list(post_ids)
+    post_list = (Post.objects.select_related('author', 'group')
+                 .filter(pk__in=post_ids).order_by())
+    posts = {post.pk: post for post in post_list}
+    return likes.mark_liked(
+        request.user, [posts[pk] for pk in post_ids if pk in posts]
+    )
 
 
 def page_not_found(request, exception):
@@ -63,8 +64,8 @@ def server_error(request):
 def index(request):
     """Возвращает 10 последних записей."""
     post_list = Post.objects.select_related('author', 'group').all()
-    post_list = post_annotate(request, post_list)
     paginator, page = set_paginator(request, post_list, 10)
+    post_annotate(request, page)
     return render(
         request,
         'index.html',
@@ -72,6 +73,17 @@ def index(request):
     )
 
 
+def popular(request):
+    """Возвращает записи по готовому рейтингу популярности"""
+    post_list = (Post.objects.select_related('author', 'group')
+                 .filter(score__gt=0).order_by('-score', '-pk'))
+    paginator = Paginator(post_list, 10)
+    page = paginator.get_page(request.GET.get('page'))
+    post_annotate(request, page)
+    return render(request, 'popular.html',
+                  {'page': page, 'paginator': paginator})
+
+
 def groups_overview(request):
     """Возвращает страницу со списком сообществ"""
     follow_exist = (FollowGroup.objects.filter(
@@ -90,8 +102,8 @@ def group_posts(request, slug):
     group.is_followed = (group.group_following
                          .filter(user=user).exists())
     post_list = group.posts.select_related('author').all()
-    post_list = post_annotate(request, post_list)
     paginator, page = set_paginator(request, post_list, 10)
+    post_annotate(request, page)
     return render(
         request,
         'group.html',
@@ -102,11 +114,10 @@ def group_posts(request, slug):
 def profile(request, username):
     """Возвращает профиль пользователя"""
     author = get_object_or_404(User, username=username)
-    post_list = post_annotate(request, author.posts.all())
-    paginator, page = set_paginator(request, post_list, 10)
-    follow = follow_count(request.user, author)
-    activity = Activity.objects.filter(user=author).first()
-    last_seen = activity.time if activity else None
+    paginator, page = set_paginator(request, author.posts.all(), 10)
+    post_annotate(request, page)
+    follow = stats.profile_stats(request.user, author)
+    last_seen = activity.last_seen(author)
     return render(
         request,
         'profile.html',
@@ -118,14 +129,10 @@ def profile(request, username):
 def post_view(request, username, post_id):
     """Возвращает страницу просмотра конкретной записи"""
     post = get_object_or_404(Post, pk=post_id, author__username=username)
-    post.num_likes = Like.objects.filter(post=post_id).count()
-    post.is_liked = (request.user.likes
-                     .filter(post=post_id).exists())
-    follow = follow_count(request.user, post.author)
-    activity = Activity.objects.filter(user=post.author).first()
-    last_seen = activity.time if activity else None
+    post.is_liked = post.pk in likes.liked_ids(request.user, [post.pk])
+    follow = stats.profile_stats(request.user, post.author)
+    last_seen = activity.last_seen(post.author)
     comments = post.comments.all()
-    post.num_comments = comments.count()
     form = CommentForm()
     return render(
         request,
@@ -144,6 +151,7 @@ def new_post(request):
         post = form.save()
         post.author = request.user
         post.save()
+        images.schedule(post, form.cleaned_data['crop_data'])
         return redirect('/')
     return render(request, 'new.html', {'form': form})
 
@@ -169,6 +177,9 @@ def post_edit(request, username, post_id):
     if form.is_valid():
         post = form.save()
         post.save()
+        crop = form.cleaned_data['crop_data']
+        if 'image' in form.changed_data or crop:
+            images.schedule(post, crop)
         return redirect(reverse('post', args=(username, post_id)))
     return render(request, 'new.html', {'form': form, 'post': post})
 
@@ -197,10 +208,10 @@ def del_comment(request, username, post_id, comment_id):
 @login_required
 def liked_posts(request):
     """Возвращает избранные записи"""
-    likes = request.user.likes.select_related('post')
-    post_list = Post.objects.filter(pk__in=likes.values('post')).select_related('author')
-    post_list = post_annotate(request, post_list)
+    user_likes = request.user.likes.values('post')
+    post_list = Post.objects.filter(pk__in=user_likes).select_related('author')
     paginator, page = set_paginator(request, post_list, 10)
+    post_annotate(request, page)
     return render(request, "liked_posts.html",
                   {'page': page, 'paginator': paginator})
 
@@ -208,15 +219,56 @@ def liked_posts(request):
 @login_required
 def follow_index(request):
     """Возвращает записи избранных авторов"""
-    follow_list = request.user.follower.all()
-    post_list = (Post.objects.select_related('author', 'group')
-                 .filter(author__following__in=follow_list))
-    post_list = post_annotate(request, post_list)
-    paginator, page = set_paginator(request, post_list, 10)
+    entries = Timeline.objects.filter(user=request.user).only(
+        'id', 'pub_date', 'post_id'
+    )
+    paginator, page = set_paginator(request, entries, 10)
+    page.object_list = timeline_posts(
+        request, [entry.post_id for entry in page.object_list]
+    )
     return render(request, "follow.html",
                   {'page': page, 'paginator': paginator})
 
 
+def post_search(request):
+    """Возвращает записи, найденные по тексту записи и комментариев"""
+    query = request.GET.get('q', '').strip()
+    post_ids = search.search_ids(query) if query else []
+    paginator = Paginator(post_ids, 10)
+    page = paginator.get_page(request.GET.get('page'))
+    page.object_list = timeline_posts(request, page.object_list)
+    return render(request, 'search.html',
+                  {'page': page, 'paginator': paginator, 'query': query})
+
+
+def new_posts(request):
+    """Возвращает число и id записей ленты новее курсора since
+
+    С `cards=1` в ответ добавляются карточки этих записей.
+    """
+    feed = request.GET.get('feed', 'index')
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest()
+    if feed not in live.FEEDS:
+        return HttpResponseBadRequest()
+    if feed == 'group' and not request.GET.get('group'):
+        return HttpResponseBadRequest()
+    if feed == 'follow' and not request.user.is_authenticated:
+        return JsonResponse({}, status=403)
+    ids, count = live.newer(feed, since, request.user,
+                            request.GET.get('group'))
+    data = {'count': count, 'ids': ids}
+    if request.GET.get('cards') and ids:
+        data['html'] = ''.join(
+            render_to_string('includes/post_item.html', {'post': post},
+                             request)
+            for post in timeline_posts(request, ids)
+        )
+    return JsonResponse(data)
+
+
 @login_required
 def profile_follow(request, username):
     """Подписывает пользователя на автора"""
@@ -234,42 +286,61 @@ def profile_unfollow(request, username):
     return redirect(reverse('profile', args=(username,)))
 
 
-@login_required
-def post_like(request):
-    """Создает лайки"""
-    post = get_object_or_404(Post, pk=int(request.GET.get('post_id', False)))
-    Like.objects.get_or_create(user=request.user, post=post or None)
-    num_likes = request.GET['num_likes']
-    num = int(num_likes or 0) + 1
-    data = {
-        'num_likes': num,
-        'is_liked': 'True'
-    }
-    return JsonResponse(data)
+def parse_likes(request):
+    """Возвращает пары (id записи, лайк) из формы или JSON-тела"""
+    if request.content_type == 'application/json':
+        items = json.loads(request.body)['likes']
+    else:
+        items = [request.POST]
+    pairs = []
+    for item in items:
+        liked = item.get('liked')
+        if isinstance(liked, str):
+            # Неизвестная строка дает KeyError и ответ 400
+            liked = {'true': True, 'false': False, '': None}[liked.lower()]
+        elif liked is not None and not isinstance(liked, bool):
+            raise TypeError('liked должен быть true, false или null')
+        pairs.append((int(item['post_id']), liked))
+    return pairs
 
 
 @login_required
-def post_remove_like(request):
-    """Удаляет лайки"""
-    post = get_object_or_404(Post, pk=int(request.GET.get('post_id', False)))
-    get_object_or_404(Like, user=request.user, post=post).delete()
-    num_likes = request.GET['num_likes']
-    num = int(num_likes) - 1 or ''
-    data = {
-        'num_likes': num,
-        'is_liked': 'False'
-    }
-    return JsonResponse(data)
+@require_POST
+def post_like(request):
+    """Ставит или снимает лайки и возвращает актуальные счетчики
+
+    Без `liked` лайк переключается. Несколько нажатий можно отправить
+    одним запросом: {"likes": [{"post_id": 1, "liked": true}, ...]}.
+    """
+    try:
+        pairs = parse_likes(request)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return HttpResponseBadRequest()
+    post_ids = {post_id for post_id, _ in pairs}
+    if Post.objects.filter(pk__in=post_ids).count() != len(post_ids):
+        raise Http404
+    current = likes.liked_ids(request.user, post_ids)
+    wanted = {}
+    for post_id, liked in pairs:
+        if liked is None:
+            liked = not wanted.get(post_id, post_id in current)
+        wanted[post_id] = liked
+    num_likes = likes.set_likes(request.user, wanted)
+    return JsonResponse({'likes': [
+        {'post_id': post_id, 'is_liked': liked,
+         'num_likes': num_likes[post_id]}
+        for post_id, liked in wanted.items()
+    ]})
 
 
 @login_required
 def follow_groups(request):
     """Возвращает записи избранных сообществ"""
-    follow_list = request.user.group_follower.all()
+    follow_list = request.user.group_follower.values('group')
     post_list = (Post.objects.select_related('group')
-                 .filter(group__group_following__in=follow_list))
-    post_list = post_annotate(request, post_list)
+                 .filter(group__in=follow_list))
     paginator, page = set_paginator(request, post_list, 10)
+    post_annotate(request, page)
     return render(request, 'follow_groups.html',
                   {'page': page, 'paginator': paginator})
 
@@ -0,0 +1,28 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django serves ASGI starting with 3.0 (async views with 3.1), while the
+project is pinned to 2.2. Until the upgrade, deploy ``yatube.wsgi`` with the
+gthread workers configured in ``gunicorn.conf.py``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+if django.VERSION < (3, 0):
+    raise ImproperlyConfigured(
+        'ASGI requires Django 3.0 or newer, serve yatube.wsgi instead'
+    )
+
+from django.core.asgi import get_asgi_application  # noqa: E402
+
+application = get_asgi_application()
@@ -0,0 +1,229 @@
+"""Общий для всех воркеров кеш в файле SQLite в режиме WAL.
+
+LocMemCache у каждого воркера gunicorn свой, поэтому с ростом числа
+воркеров падает доля попаданий, а инвалидация в одном воркере не видна
+остальным. Этот бэкенд хранит записи в одном файле (например, в
+/dev/shm), вытесняет давно не читавшиеся записи (LRU) и атомарно
+выполняет incr в транзакции. Ошибки SQLite (файл переполнен, база
+занята) пишутся в лог и считаются промахом или пропущенной записью,
+а не превращают каждую страницу в ошибку 500.
+"""
+import functools
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+logger = logging.getLogger(__name__)
+
+# Время последнего чтения обновляется не чаще, чем раз в столько секунд,
+# чтобы чтения не превращались в запись на каждое обращение.
+ACCESS_RESOLUTION = 1.0
+# Размер кеша проверяется раз в столько записей, а не при каждой
+CULL_CHECK_EVERY = 100
+
+
+def _fail_safe(result):
+    """Возвращает result вместо ошибки SQLite"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except sqlite3.Error:
+                logger.exception('Ошибка кеша %s в %s', self._path,
+                                 method.__name__)
+                return result
+        return wrapper
+    return decorator
+
+
+class SQLiteCache(BaseCache):
+    """Кеш-бэкенд поверх SQLite (WAL)"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        connection = sqlite3.connect(
+            self._path, timeout=5, isolation_level=None,
+            check_same_thread=False
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB, '
+            'expires REAL, accessed REAL NOT NULL)'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)'
+        )
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        self._local.writes = 0
+        return connection
+
+    @staticmethod
+    def _encode(value):
+        # Целые числа храним как INTEGER, чтобы incr выполнялся в SQL
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return sqlite3.Binary(
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        )
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _get_row(self, connection, key, now):
+        row = connection.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now)
+            )
+            return None
+        if now - accessed > ACCESS_RESOLUTION:
+            connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key)
+            )
+        return value
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        try:
+            value = self._get_row(self._connection(), key, time.time())
+        except sqlite3.Error:
+            logger.exception('Ошибка кеша %s в get', self._path)
+            return default
+        return default if value is None else self._decode(value)
+
+    @_fail_safe(None)
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            (key, self._encode(value), self.get_backend_timeout(timeout),
+             time.time())
+        )
+        self._cull(connection)
+
+    @_fail_safe(False)
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now)
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                (key, self._encode(value),
+                 self.get_backend_timeout(timeout), now)
+            ).rowcount
+        if added:
+            self._cull(connection)
+        return bool(added)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        try:
+            return self._incr(key, delta)
+        except sqlite3.Error:
+            # Для вызывающего кода это то же, что отсутствующий ключ
+            logger.exception('Ошибка кеша %s в incr', self._path)
+            raise ValueError(f"Key '{key}' not found")
+
+    def _incr(self, key, delta):
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            updated = connection.execute(
+                'UPDATE cache SET value = value + ?, accessed = ? '
+                'WHERE key = ? AND typeof(value) = \'integer\' '
+                'AND (expires IS NULL OR expires > ?)',
+                (delta, now, key, now)
+            ).rowcount
+            if not updated:
+                raise ValueError(f"Key '{key}' not found")
+            return connection.execute(
+                'SELECT value FROM cache WHERE key = ?', (key,)
+            ).fetchone()[0]
+
+    @_fail_safe(False)
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        return bool(self._connection().execute(
+            'UPDATE cache SET expires = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, now)
+        ).rowcount)
+
+    @_fail_safe(False)
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._get_row(self._connection(), key, time.time()) is not None
+
+    @_fail_safe(None)
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    @_fail_safe(None)
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живет весь срок потока и переиспользуется запросами
+        pass
+
+    def _cull(self, connection):
+        """Удаляет просроченные и давно не читавшиеся записи"""
+        self._local.writes += 1
+        if self._local.writes % CULL_CHECK_EVERY:
+            return
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (count // self._cull_frequency,)
+        )
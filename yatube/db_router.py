@@ -0,0 +1,78 @@
+"""Маршрутизация чтений на реплики базы.
+
+Чтения уходят на реплику только внутри безопасного (GET/HEAD/OPTIONS)
+запроса. Запись, служебные команды и фоновые потоки работают с
+основной базой. Если запрос что-то записал, его дальнейшие чтения тоже
+идут в основную базу, а ответ ставит cookie: следующие
+REPLICA_PIN_SECONDS секунд пользователь читает из основной базы и видит
+свою новую запись, пока реплика догоняет.
+
+Реплики задаются путями в DATABASE_REPLICAS. Для локальной проверки
+подойдут копии файла SQLite, сделанные командой copy_replicas.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Сессии читаются сразу после входа, поэтому всегда из основной базы
+PRIMARY_APPS = ('sessions',)
+
+_state = threading.local()
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES
+            if alias.startswith('replica')]
+
+
+class ReplicaRouter:
+    """Чтение с реплик в запросах без записи, запись в основную базу"""
+
+    def __init__(self, replicas=None):
+        self.replicas = (replica_aliases() if replicas is None
+                         else list(replicas))
+
+    def db_for_read(self, model, **hints):
+        if (not self.replicas or not getattr(_state, 'replica', False)
+                or model._meta.app_label in PRIMARY_APPS):
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.replica = False
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *self.replicas}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики - копии основной базы и не мигрируются отдельно
+        return db == DEFAULT_DB_ALIAS
+
+
+def replica_routing(get_response):
+
+    def middleware(request):
+        _state.replica = (request.method in SAFE_METHODS
+                          and PIN_COOKIE not in request.COOKIES)
+        _state.wrote = False
+        try:
+            response = get_response(request)
+        finally:
+            wrote = _state.wrote or request.method not in SAFE_METHODS
+            _state.replica = _state.wrote = False
+        if wrote:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    return middleware
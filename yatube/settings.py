@@ -50,12 +50,18 @@ LOGGING = {
         },
     },
     'loggers': {
-        'django.db.backends': {
+        'posts.middleware.server_timing': {
             'handlers': ['console'],
-            'level': 'DEBUG',
-        }
+            'level': 'INFO',
+        },
     },
 }
+# Каждый SQL-запрос в консоль только при отладке
+if DEBUG:
+    LOGGING['loggers']['django.db.backends'] = {
+        'handlers': ['console'],
+        'level': 'DEBUG',
+    }
 
 # Application definition
 
@@ -71,13 +77,14 @@ INSTALLED_APPS = [
     'django.contrib.sites',
     'django.contrib.flatpages',
     'sorl.thumbnail',
-    'debug_toolbar',
     'rest_framework',
     # 'corsheaders',
     'api',
 ]
 
 MIDDLEWARE = [
+    'posts.middleware.server_timing.server_timing',
+    'yatube.db_router.replica_routing',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,10 +92,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'posts.middleware.user_activity.user_activity',
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('posts.middleware.user_activity.user_activity'),
+        'debug_toolbar.middleware.DebugToolbarMiddleware'
+    )
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
@@ -120,6 +133,17 @@ DATABASES = {
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
+# Реплики только для чтения: пути к файлам через запятую
+for number, path in enumerate(
+        filter(None, os.getenv('DATABASE_REPLICAS', '').split(','))):
+    DATABASES[f'replica_{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['yatube.db_router.ReplicaRouter']
+# Сколько секунд после записи пользователь читает из основной базы
+REPLICA_PIN_SECONDS = 10
 
 
 # Password validation
@@ -160,6 +184,17 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+# Общий для всех воркеров кеш (например, /dev/shm/yatube-cache.sqlite3)
+if os.getenv('SHARED_CACHE_PATH'):
+    CACHES['default'] = {
+        'BACKEND': 'yatube.cache.SQLiteCache',
+        'LOCATION': os.getenv('SHARED_CACHE_PATH'),
+        # Карточка занимает порядка 5 КБ: 20000 записей помещаются в
+        # shm_size контейнера (docker-compose.yaml) с запасом
+        'OPTIONS': {'MAX_ENTRIES': int(
+            os.getenv('SHARED_CACHE_MAX_ENTRIES', 20000)
+        )},
+    }
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
@@ -169,6 +204,8 @@ STATIC_URL = '/static/'
 # теперь логотип можно будет запросить по адресу sitename.ex**/static/**images/logo.png
 # задаём адрес директории, куда командой *collectstatic* будет собрана вся статика
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+# Имена с хешем содержимого и сжатые копии .gz/.br для nginx
+STATICFILES_STORAGE = 'yatube.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -181,6 +218,38 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 LAST_ACTIVITY_INTERVAL_SECS = 10
+# Как часто буфер посещений записывается в базу
+ACTIVITY_FLUSH_INTERVAL_SECS = 60
+# Курсорная паджинация лент вместо постраничной (?after= / ?before=)
+CURSOR_PAGINATION = (
+    os.environ.get('CURSOR_PAGINATION', '').lower() in ('1', 'true', 'yes')
+)
+# Потоки для фоновой подготовки миниатюр (0 - сразу после коммита)
+POST_IMAGE_WORKERS = int(os.environ.get('POST_IMAGE_WORKERS', 2))
+# Процессы для обрезки картинок (0 - в потоке пула миниатюр)
+POST_IMAGE_PROCESSES = int(os.environ.get('POST_IMAGE_PROCESSES', 0))
+# Наибольшая сторона сохраняемой картинки в пикселях
+POST_IMAGE_MAX_SIDE = 2048
+# Ширины вариантов картинки в карточке для srcset
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+# Форматы вариантов в порядке предпочтения, неподдерживаемые Pillow
+# пропускаются. JPEG нужен для браузеров без <picture>
+POST_IMAGE_FORMATS = ('avif', 'webp', 'jpeg')
+# Сколько лучших совпадений возвращает полнотекстовый поиск
+SEARCH_MAX_RESULTS = 1000
+# За сколько дней записи попадают в рейтинг популярных
+RANKING_WINDOW_DAYS = 7
+# Доля запросов, для которых собираются замеры и пишется строка в лог
+SERVER_TIMING_SAMPLE_RATE = float(
+    os.environ.get('SERVER_TIMING_SAMPLE_RATE', 1 if DEBUG else 0.01)
+)
+# Заголовок Server-Timing получают все клиенты, а не только персонал
+SERVER_TIMING_HEADER = DEBUG
+# Раз в столько запросов к представлению в лог пишутся средние по нему
+# (0 - не собирать)
+SERVER_TIMING_AGGREGATE_EVERY = int(
+    os.environ.get('SERVER_TIMING_AGGREGATE_EVERY', 0)
+)
 SITE_ID = 2
 
 # API
@@ -0,0 +1,57 @@
+"""Хранилище статики с хешами в именах и сжатыми копиями.
+
+collectstatic дает файлам имена с хешем содержимого (через manifest) и
+кладет рядом с текстовыми файлами сжатые копии `.gz` и, если установлен
+пакет brotli, `.br`. nginx отдает их через gzip_static без сжатия на
+лету, а файлы с хешем кешируются браузером навсегда.
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.xml', '.map', '.ico')
+# Мелкие файлы сжатие почти не уменьшает
+MIN_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хешами в именах и копиями .gz/.br"""
+
+    def stored_name(self, name):
+        # Без collectstatic (разработка, тесты) манифеста нет, отдаем
+        # исходное имя вместо ошибки при отрисовке шаблона. Если манифест
+        # есть, файл без записи в нем - ошибка, как в базовом классе
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed = set()
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if hashed_name and not isinstance(processed, Exception):
+                hashed.add(hashed_name)
+        for name in sorted(hashed):
+            if name.endswith(COMPRESS_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        """Кладет рядом с файлом сжатые копии, если они меньше"""
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            data = source.read()
+        if len(data) < MIN_SIZE:
+            return
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+        for suffix, compressed in variants.items():
+            if len(compressed) < len(data):
+                with open(path + suffix, 'wb') as target:
+                    target.write(compressed)